@@ -0,0 +1,169 @@
+import bisect
+import itertools
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import registry
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("key", "traffic_class", "granted", "event")
+
+    def __init__(self, key, traffic_class: str):
+        self.key = key
+        self.traffic_class = traffic_class
+        self.granted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """Per-class concurrency limits with a shared priority queue.
+
+    Every request belongs to a traffic class with its own concurrency
+    `limit`, queue size and queue timeout, and all classes share
+    `max_concurrent` slots. Whenever a slot frees up it goes to the waiting
+    request with the lowest priority number (then the oldest). A class that
+    is at its own limit doesn't block lower priority classes behind it.
+    Requests whose class queue is full are rejected right away with 429.
+    Requests still queued after their class timeout get 503. Both come with
+    a Retry-After estimated from recent service times.
+
+    Queued requests hold a worker thread while they wait, so the limits plus
+    queue sizes of the low priority classes should stay well below the
+    worker's thread count.
+    """
+
+    def __init__(self, classes: Dict[str, dict], max_concurrent: int):
+        self.classes = classes
+        self.max_concurrent = max_concurrent
+        self._running = {name: 0 for name in classes}
+        self._queued = {name: 0 for name in classes}
+        self._service_time = {name: 1.0 for name in classes}
+        self._total_running = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        self._queue_depth = registry.gauge(
+            "openplugin_admission_queue_depth", "Requests waiting for admission, per traffic class", ["traffic_class"])
+        self._in_flight = registry.gauge(
+            "openplugin_admission_in_flight", "Admitted requests being served, per traffic class", ["traffic_class"])
+        self._wait = registry.histogram(
+            "openplugin_admission_wait_seconds", "Time spent queued before admission or rejection", ["traffic_class", "outcome"])
+        self._rejected = registry.counter(
+            "openplugin_admission_rejected_total", "Requests turned away by admission control", ["traffic_class", "reason"])
+
+    def _dispatch(self):
+        # grants free slots in priority order, skipping classes that are at their own limit
+        index = 0
+        while index < len(self._waiters) and self._total_running < self.max_concurrent:
+            _, waiter = self._waiters[index]
+            name = waiter.traffic_class
+            if self._running[name] >= self.classes[name]["limit"]:
+                index += 1
+                continue
+            del self._waiters[index]
+            self._queued[name] -= 1
+            self._running[name] += 1
+            self._total_running += 1
+            waiter.granted = True
+            waiter.event.set()
+            self._queue_depth.set(self._queued[name], traffic_class=name)
+            self._in_flight.set(self._running[name], traffic_class=name)
+
+    def _retry_after(self, name: str) -> int:
+        # roughly how long the requests already queued in this class will take to drain
+        queued = self._queued[name] + 1
+        return max(1, min(60, math.ceil(self._service_time[name] * queued / self.classes[name]["limit"])))
+
+    def acquire(self, name: str) -> "_Ticket":
+        config = self.classes[name]
+        start = time.perf_counter()
+        waiter = _Waiter((config["priority"], next(self._sequence)), name)
+        with self._lock:
+            bisect.insort(self._waiters, (waiter.key, waiter))
+            self._queued[name] += 1
+            self._dispatch()
+            if not waiter.granted and self._queued[name] > config["max_queue"]:
+                self._waiters.remove((waiter.key, waiter))
+                self._queued[name] -= 1
+                self._rejected.inc(traffic_class=name, reason="queue_full")
+                raise AdmissionRejected(429, self._retry_after(name), f"Too many queued {name} requests")
+            self._queue_depth.set(self._queued[name], traffic_class=name)
+
+        if not waiter.granted:
+            waiter.event.wait(config["queue_timeout"])
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove((waiter.key, waiter))
+                self._queued[name] -= 1
+                self._queue_depth.set(self._queued[name], traffic_class=name)
+                retry_after = self._retry_after(name)
+        waited = time.perf_counter() - start
+        if not waiter.granted:
+            self._wait.observe(waited, traffic_class=name, outcome="timeout")
+            self._rejected.inc(traffic_class=name, reason="timeout")
+            raise AdmissionRejected(503, retry_after, f"Server busy, {name} request was not admitted within {config['queue_timeout']}s")
+        self._wait.observe(waited, traffic_class=name, outcome="admitted")
+        return _Ticket(self, name)
+
+    def release(self, ticket: "_Ticket"):
+        elapsed = time.perf_counter() - ticket.admitted_at
+        name = ticket.traffic_class
+        with self._lock:
+            self._running[name] -= 1
+            self._total_running -= 1
+            # exponentially weighted, so Retry-After follows the current load
+            self._service_time[name] = 0.8 * self._service_time[name] + 0.2 * elapsed
+            self._in_flight.set(self._running[name], traffic_class=name)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._total_running,
+                "classes": {
+                    name: {
+                        **config,
+                        "running": self._running[name],
+                        "queued": self._queued[name],
+                        "avg_service_seconds": round(self._service_time[name], 3),
+                    }
+                    for name, config in self.classes.items()
+                },
+            }
+
+
+class _Ticket:
+    __slots__ = ("controller", "traffic_class", "admitted_at")
+
+    def __init__(self, controller: AdmissionController, traffic_class: str):
+        self.controller = controller
+        self.traffic_class = traffic_class
+        self.admitted_at = time.perf_counter()
+
+
+DEFAULT_CLASSES = {
+    "chat": {"priority": 0, "limit": 32, "max_queue": 16, "queue_timeout": 10},
+    "plugin": {"priority": 1, "limit": 16, "max_queue": 8, "queue_timeout": 10},
+    "eval": {"priority": 2, "limit": 6, "max_queue": 6, "queue_timeout": 20},
+    "admin": {"priority": 3, "limit": 2, "max_queue": 2, "queue_timeout": 5},
+}
+
+
+def load_classes(overrides: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    # overrides are merged per class, e.g. {"eval": {"limit": 4}}
+    classes = {name: dict(config) for name, config in DEFAULT_CLASSES.items()}
+    for name, config in (overrides or {}).items():
+        classes[name] = {**classes.get(name, {}), **config}
+    return classes
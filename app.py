@@ -1,91 +1,766 @@
-from flask import Flask, request, jsonify, session, redirect
+from flask import Flask, request, jsonify, redirect, Response, stream_with_context, g, has_request_context
 from dotenv import load_dotenv
 from flask_cors import CORS
 import os
 import json
-from datetime import datetime
-from collections import deque
-from typing import Dict, List, TypedDict
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from openplugincore import openplugin_completion, OpenPluginMemo
-from datetime import datetime
-from urllib.parse import quote, unquote, urlencode
+from urllib.parse import unquote, urlencode, urlsplit
+import openai
 from openai import ChatCompletion
 from pymongo import MongoClient
-from oauthlib.oauth2 import WebApplicationClient
 import requests
 import urllib
+import openplugincore.openplugin
+import openplugincore.openplugin_memo
+import oplangchain.chains.openai_functions.openapi
+import oplangchain.utilities.openapi
+from rate_limiter import create_rate_limiter
+from upstream import UpstreamExecutor, UpstreamBusy, UpstreamTimeout
+from cache import TTLCache
+from response_cache import ResponseCache, request_cache_key
+from plugin_directory import PluginDirectoryRefresher, PLUGIN_DIRECTORY_URL
+from http_pool import OutboundHTTP
+from metrics import registry
+from logging_config import configure_logging
+from oauth_store import OAuthClientConfigs, create_state_store
+from token_budget import TokenBudget
+from prompt_pool import StimulusPromptPool
+from manifest_validation import ManifestValidator, not_modified
+from usage_ledger import UsageLedger
+from lazy import Lazy
+from admission import AdmissionController, AdmissionRejected, load_classes
+from plugin_health import PluginHealth, CircuitOpen
 
 load_dotenv()
 if (os.environ.get('DEVELOPMENT')):
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1' 
 
+configure_logging(os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger("openplugin-api")
+
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 PORT = int(os.getenv('PORT'))
 MONGODB_URI = os.getenv('MONGODB_URI')
 SESSION_SECRET = os.getenv('SESSION_SECRET')
 
-# Setup MongoDB connection
-client = MongoClient(MONGODB_URI, tlsAllowInvalidCertificates=True)
+# Setup MongoDB connection, made on first use and again in every forked
+# worker, so importing (or preloading) the app never opens a connection
+client = Lazy(lambda: MongoClient(MONGODB_URI, tlsAllowInvalidCertificates=True), reset_after_fork=True)
 db = client["openplugin-io"]
 
+# OAuth client configs (including secrets) are cached in memory only, for at
+# most OAUTH_CONFIG_TTL seconds
+oauth_clients = OAuthClientConfigs(
+    db["openplugin-auth"],
+    ttl=float(os.getenv('OAUTH_CONFIG_TTL', 300)),
+    max_entries=int(os.getenv('OAUTH_CONFIG_MAX_ENTRIES', 1024)),
+)
+OAUTH_CONFIG_WATCH = bool(os.getenv('OAUTH_CONFIG_WATCH'))
+
+# In-flight OAuth flows are kept server side keyed by `state` instead of in the
+# cookie session: "mongo" works across workers, "memory" only for a single process
+OAUTH_STATE_BACKEND = os.getenv('OAUTH_STATE_BACKEND', 'mongo')
+OAUTH_STATE_TTL = float(os.getenv('OAUTH_STATE_TTL', 600))
+oauth_states = create_state_store(OAUTH_STATE_BACKEND, OAUTH_STATE_TTL, db=db)
+# Each flow is bound to the browser that started it through an HttpOnly nonce
+# cookie, so a state+code pair sent to someone else can't be redeemed by them
+OAUTH_NONCE_COOKIE = 'openplugin_oauth_nonce'
+
+# Every outbound call (OpenAI, plugin manifests/specs/APIs, OAuth token
+# exchanges) shares one pooled keep-alive session instead of opening a new
+# TCP+TLS connection per request
+outbound = OutboundHTTP(
+    pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS', 32)),
+    pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', 64)),
+    timeout=float(os.getenv('HTTP_TIMEOUT', 30)),
+    retries=int(os.getenv('HTTP_RETRIES', 2)),
+    backoff_factor=float(os.getenv('HTTP_BACKOFF_FACTOR', 0.3)),
+    max_hosts=int(os.getenv('HTTP_STATS_MAX_HOSTS', 256)),
+)
+openai.requestssession = outbound.session
+outbound.install(
+    openplugincore.openplugin,
+    openplugincore.openplugin_memo,
+    oplangchain.chains.openai_functions.openapi,
+    oplangchain.utilities.openapi,
+)
+# pooled connections must not be shared with the process that forked us
+os.register_at_fork(after_in_child=outbound.adapter.poolmanager.clear)
+
 open_plugin_memo = OpenPluginMemo()
-open_plugin_memo.init()
+
+# The plugin directory and the most used plugins are loaded and kept fresh by a
+# background thread so no request ever waits on a full directory load
+PLUGIN_DIRECTORY_REFRESH_INTERVAL = float(os.getenv('PLUGIN_DIRECTORY_REFRESH_INTERVAL', 600))
+PLUGIN_WARM_TOP_N = int(os.getenv('PLUGIN_WARM_TOP_N', 20))
+PLUGIN_WARM_NAMESPACES = [namespace for namespace in os.getenv('PLUGIN_WARM_NAMESPACES', '').split(',') if namespace]
+# how long a request may wait for a cold worker's first directory load
+PLUGIN_DIRECTORY_WAIT = float(os.getenv('PLUGIN_DIRECTORY_WAIT', 5))
+plugin_directory = PluginDirectoryRefresher(
+    open_plugin_memo,
+    PLUGIN_DIRECTORY_REFRESH_INTERVAL,
+    PLUGIN_WARM_TOP_N,
+    warm_namespaces=PLUGIN_WARM_NAMESPACES,
+    directory_url=os.getenv('PLUGIN_DIRECTORY_URL', PLUGIN_DIRECTORY_URL),
+    session=outbound,
+    # the usage ledger is created further down; resolved when the first warm-up runs
+    popular_plugins=lambda limit: usage_ledger.top_plugins(limit) if usage_ledger is not None else [],
+)
+
+# Plugins initialized from a root url (manifest + OpenAPI spec) are reused
+# across requests instead of being refetched every time
+PLUGIN_CACHE_MAX_ENTRIES = int(os.getenv('PLUGIN_CACHE_MAX_ENTRIES', 128))
+PLUGIN_CACHE_TTL = float(os.getenv('PLUGIN_CACHE_TTL', 600))
+PLUGIN_CACHE_MAX_BYTES = int(os.getenv('PLUGIN_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+plugin_cache = TTLCache(
+    PLUGIN_CACHE_MAX_ENTRIES,
+    PLUGIN_CACHE_TTL,
+    max_bytes=PLUGIN_CACHE_MAX_BYTES,
+    sizeof=lambda plugin: len(json.dumps(plugin.manifest, default=str)) + len(json.dumps(plugin.functions, default=str)),
+)
+
+def normalize_root_url(root_url: str) -> str:
+    parts = urlsplit(root_url.strip())
+    scheme = parts.scheme.lower() or "https"
+    netloc = parts.netloc.lower()
+    if (scheme, parts.port) in (("http", 80), ("https", 443)):
+        netloc = netloc.rsplit(":", 1)[0]
+    return f"{scheme}://{netloc}{parts.path.rstrip('/')}"
+
+def init_root_url_plugin(root_url: str):
+    root_url = normalize_root_url(root_url)
+    return plugin_cache.get_or_load(root_url, lambda: open_plugin_memo.init_openplugin(root_url=root_url))
+
+# /eval/tentative validates manifests and OpenAPI specs fetched through the
+# pool; documents are reused for REVALIDATE seconds, then fetched conditionally.
+# /eval/tentative is unauthenticated, so document size and cache bytes are capped
+manifest_validator = ManifestValidator(
+    outbound,
+    max_entries=int(os.getenv('MANIFEST_CACHE_MAX_ENTRIES', 4096)),
+    revalidate_after=float(os.getenv('MANIFEST_REVALIDATE_AFTER', 300)),
+    max_bytes=int(os.getenv('MANIFEST_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    max_document_bytes=int(os.getenv('MANIFEST_MAX_DOCUMENT_BYTES', 1024 * 1024)),
+)
+
+# Slow OpenAI/plugin calls run on a shared bounded pool so a request can time
+# out without tying up its worker thread for the whole upstream round trip
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv('UPSTREAM_MAX_IN_FLIGHT', 256))
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', 60))
+upstream = UpstreamExecutor(UPSTREAM_MAX_IN_FLIGHT, UPSTREAM_TIMEOUT)
+
+# Every plugin API gets its own circuit breaker: after PLUGIN_BREAKER_FAILURES
+# failed or slow calls in a row, requests for that plugin fail fast for
+# PLUGIN_BREAKER_OPEN_SECONDS instead of waiting on a backend that is down.
+# PLUGIN_HEDGING=on sends a second copy of GET operations that outlive the plugin's p95
+plugin_health = PluginHealth(
+    failure_threshold=int(os.getenv('PLUGIN_BREAKER_FAILURES', 5)),
+    open_seconds=float(os.getenv('PLUGIN_BREAKER_OPEN_SECONDS', 30)),
+    slow_call_seconds=float(os.getenv('PLUGIN_BREAKER_SLOW_SECONDS', 20)),
+    hedge=os.getenv('PLUGIN_HEDGING', 'off') == 'on',
+    max_breakers=int(os.getenv('PLUGIN_BREAKER_MAX_ENTRIES', 1024)),
+)
+
+def guard_plugin(plugin, breaker_name: str):
+    # refuses the request while the plugin's breaker is open, then times its API calls.
+    # breaker_name must be a known namespace or a normalized root url
+    try:
+        probe = plugin_health.breaker(breaker_name).allow(breaker_name)
+    except CircuitOpen as e:
+        raise ServiceError(
+            {"error": f"CircuitOpen error: {str(e)}", "retry_after": round(e.retry_after)},
+            503,
+            {"Retry-After": str(round(e.retry_after))},
+        )
+    return plugin_health.guard(plugin, breaker_name, probe)
+
+# /plugin runs at temperature 0, so identical requests can be answered from
+# cache: "off", "memory" (per process) or "mongo" (memory backed by a shared tier)
+PLUGIN_RESPONSE_CACHE = os.getenv('PLUGIN_RESPONSE_CACHE', 'off')
+PLUGIN_RESPONSE_CACHE_TTL = float(os.getenv('PLUGIN_RESPONSE_CACHE_TTL', 300))
+# per-plugin overrides keyed by namespace or normalized root url, e.g. {"weather": 60}
+PLUGIN_RESPONSE_CACHE_TTLS = json.loads(os.getenv('PLUGIN_RESPONSE_CACHE_TTLS', '{}'))
+PLUGIN_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('PLUGIN_RESPONSE_CACHE_MAX_ENTRIES', 1024))
+response_cache = None
+if PLUGIN_RESPONSE_CACHE != 'off':
+    response_cache = ResponseCache(
+        TTLCache(PLUGIN_RESPONSE_CACHE_MAX_ENTRIES, PLUGIN_RESPONSE_CACHE_TTL),
+        collection=db["openplugin-response-cache"] if PLUGIN_RESPONSE_CACHE == 'mongo' else None,
+    )
+
+# Concurrent /generate_prompt calls for one plugin share a single LLM call. The
+# pool ("off", "memory" or "mongo") additionally reuses up to SIZE prompts per
+# plugin for MAX_AGE seconds before generating new ones
+STIMULUS_PROMPT_POOL = os.getenv('STIMULUS_PROMPT_POOL', 'off')
+stimulus_prompts = StimulusPromptPool(
+    lambda plugin: generate_stimulous_prompt(plugin),
+    pool_size=int(os.getenv('STIMULUS_PROMPT_POOL_SIZE', 5)),
+    max_age=float(os.getenv('STIMULUS_PROMPT_POOL_MAX_AGE', 86400)),
+    collection=db["openplugin-stimulus-prompts"] if STIMULUS_PROMPT_POOL == 'mongo' else None,
+    enabled=STIMULUS_PROMPT_POOL != 'off',
+)
+
+# Conversation history is trimmed (oldest turns first) to fit the model's
+# context window after reserving room for the plugin functions and the reply
+TOKEN_BUDGET_ENABLED = os.getenv('TOKEN_BUDGET_ENABLED', 'true').lower() != 'false'
+token_budget = TokenBudget(int(os.getenv('TOKEN_BUDGET_COMPLETION_RESERVE', 512)))
+
+# Upper bound on plugins a single /eval/batch or /eval/supported/batch request
+# evaluates at once, and how long /eval/supported/batch waits for stragglers
+EVAL_BATCH_MAX_CONCURRENCY = int(os.getenv('EVAL_BATCH_MAX_CONCURRENCY', 16))
+EVAL_BATCH_DEADLINE = float(os.getenv('EVAL_BATCH_DEADLINE', 120))
+
+# A multi-plugin /plugin request runs up to MAX plugins in parallel and returns
+# whatever finished within its deadline (seconds, overridable per request)
+PLUGIN_MULTI_MAX = int(os.getenv('PLUGIN_MULTI_MAX', 8))
+PLUGIN_MULTI_DEADLINE = float(os.getenv('PLUGIN_MULTI_DEADLINE', 30))
 
 app = Flask(__name__)
 app.secret_key = SESSION_SECRET
 CORS(app)
 
-class BucketItem(TypedDict):
-    date_sent: datetime
-    plugin_name: str
+request_duration = registry.histogram(
+    "openplugin_request_duration_seconds", "Time to produce a response, per route", ["route", "method", "status"])
+stage_duration = registry.histogram(
+    "openplugin_stage_duration_seconds", "Time spent in each stage of handling a request", ["stage", "route", "plugin"])
+
+def current_route() -> str:
+    if not has_request_context():
+        return "background"
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def plugin_metric_label(plugin: str = None):
+    # label values come from request input, so only directory namespaces get their own series
+    if plugin is None:
+        return None
+    if (open_plugin_memo.plugins_directory or {}).get(plugin):
+        return plugin
+    return "root_url" if "://" in plugin else "other"
+
+def stage(name: str, plugin: str = None):
+    # times the enclosed block into the stage histogram, e.g. `with stage("rate_limit"):`
+    return stage_duration.time(stage=name, route=current_route(), plugin=plugin_metric_label(plugin))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    if "request_start" in g:
+        request_duration.observe(
+            time.perf_counter() - g.request_start,
+            route=current_route(),
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
+
+# Admission control: every route belongs to a traffic class with its own
+# concurrency limit, and queued requests are admitted chat first, admin last.
+# Classes can be tuned with ADMISSION_CLASSES, e.g. {"eval": {"limit": 4}}
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'on') != 'off'
+admission = AdmissionController(
+    load_classes(json.loads(os.getenv('ADMISSION_CLASSES', '{}'))),
+    max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', 48)),
+)
+# routes not listed here (/metrics, /ready) are never queued
+ADMISSION_ROUTE_CLASSES = {
+    '/chat_completion': 'chat',
+    '/oauth_initialization': 'chat',
+    '/oauth_token': 'chat',
+    '/plugin': 'plugin',
+    '/eval/tentative': 'eval',
+    '/eval/supported': 'eval',
+    '/eval/supported/batch': 'eval',
+    '/eval/batch': 'eval',
+    '/generate_prompt': 'eval',
+    '/admin': 'admin',
+    '/admin/http': 'admin',
+    '/admin/caches': 'admin',
+    '/admin/admission': 'admin',
+    '/admin/plugins': 'admin',
+}
+
+@app.before_request
+def admit_request():
+    traffic_class = ADMISSION_ROUTE_CLASSES.get(current_route())
+    if not ADMISSION_CONTROL or not traffic_class or request.method == 'OPTIONS':
+        return None
+    try:
+        g.admission_ticket = admission.acquire(traffic_class)
+    except AdmissionRejected as e:
+        return jsonify({"error": f"AdmissionRejected error: {str(e)}"}), e.status_code, {"Retry-After": str(e.retry_after)}
 
-class TokenInfo(TypedDict):
-    total_use: int
-    bucket: List[BucketItem]
+@app.teardown_request
+def release_admission(exception=None):
+    # streamed responses keep their slot until the stream is finished
+    ticket = g.pop("admission_ticket", None)
+    if ticket is not None:
+        admission.release(ticket)
 
 early_access_tokens = [
     '__extra__-c22a34e2-89a8-48b2-8474-c664b577526b', # public
     '__extra__-692df72b-ec3f-49e4-a1ce-fb1fbc34aebd' # public
 ]
-request_data: Dict[str, TokenInfo] = {token: {"total_use": 0, "bucket": []} for token in early_access_tokens}
-print("request_data: \n", json.dumps(request_data, indent=4))
 
-# Maximum requests allowed per minute per token
+# Maximum requests allowed per day per token
 MAX_REQUESTS_PER_DAY = 200
 
+# "memory" keeps counts per process, "mongo" shares them across workers and dynos
+RATE_LIMITER_BACKEND = os.getenv('RATE_LIMITER_BACKEND', 'memory')
+rate_limiter = create_rate_limiter(RATE_LIMITER_BACKEND, MAX_REQUESTS_PER_DAY, 86400, db=db)
+logger.info("rate limiter backend: %s", RATE_LIMITER_BACKEND)
+
+# Admitted requests are counted per token, plugin and hour in memory and
+# flushed to MongoDB in bulk; "off" leaves /admin on the rate limiter's view
+USAGE_LEDGER = os.getenv('USAGE_LEDGER', 'mongo')
+usage_ledger = None
+if USAGE_LEDGER == 'mongo':
+    usage_ledger = UsageLedger(
+        db["openplugin-usage-hourly"],
+        db["openplugin-usage-totals"],
+        flush_interval=float(os.getenv('USAGE_LEDGER_FLUSH_INTERVAL', 10)),
+        flush_size=int(os.getenv('USAGE_LEDGER_FLUSH_SIZE', 500)),
+    )
+
+_services_pid = None
+_services_lock = threading.Lock()
+
+def start_background_services():
+    # threads don't survive fork, so every process that serves requests (each
+    # gunicorn worker when the app is preloaded) starts its own; safe to call repeatedly
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        threading.Thread(target=oauth_clients.ensure_indexes, name="oauth-config-indexes", daemon=True).start()
+        if OAUTH_CONFIG_WATCH:
+            oauth_clients.watch()
+        plugin_directory.start()
+        if usage_ledger is not None:
+            usage_ledger.start()
+        _services_pid = os.getpid()
+
+def create_app():
+    # app factory for WSGI servers, e.g. gunicorn "app:create_app()"
+    start_background_services()
+    return app
+
+@app.before_request
+def ensure_background_services():
+    # servers that import `app:app` without the gunicorn hook start them on first request
+    start_background_services()
+
 def rate_limiter_pass(early_access_token: str, plugin_name: str) -> bool:
-    now = datetime.utcnow()
+    logger.info("Request from \"%s\" with plugin \"%s\"", early_access_token, plugin_name)
+    with stage("rate_limit", plugin=plugin_name):
+        admitted = rate_limiter.admit(early_access_token, plugin_name)
+    if admitted and usage_ledger is not None:
+        usage_ledger.record(early_access_token, plugin_name)
+    return admitted
+
+class ServiceError(Exception):
+    def __init__(self, body: dict, status_code: int, headers: dict = None):
+        super().__init__(body.get("error"))
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+
+def request_deadline(data: dict, maximum: float) -> float:
+    # optional per-request "deadline" in seconds, capped at the configured maximum
+    deadline = data.get("deadline", maximum)
+    # bool is an int subclass, but "deadline": true is not a number of seconds
+    if isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or not 0 < deadline < float("inf"):
+        raise ServiceError({"error": "deadline must be a positive number of seconds"}, 400)
+    return min(float(deadline), maximum)
+
+def fan_out(items: list, work, max_workers: int, deadline: float, thread_name_prefix: str):
+    # Runs work(item) for every item on its own bounded pool and yields
+    # (index, outcome, finished) in completion order. work returns a dict with a
+    # status_code; items that raise get an error outcome of their own, and items
+    # still running at the deadline are yielded last as 504s. Abandoned items keep
+    # their upstream calls running on the upstream pool, their results are dropped
+    pool = ThreadPoolExecutor(max_workers=max(1, min(len(items), max_workers)), thread_name_prefix=thread_name_prefix)
+    futures = {pool.submit(work, item): index for index, item in enumerate(items)}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            pending.discard(future)
+            try:
+                outcome = future.result()
+            except ServiceError as e:
+                outcome = {"status_code": e.status_code, "plugin_response": e.body}
+            except Exception as e:
+                # one item failing must never sink the others
+                error_class = type(e).__name__
+                error_message = str(e)
+                outcome = {"status_code": 500, "plugin_response": {"error": f"{error_class} error: {error_message}"}}
+            yield futures[future], outcome, True
+    except TimeoutError:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    for future in sorted(pending, key=futures.get):
+        yield futures[future], {"status_code": 504, "plugin_response": {"error": f"Deadline exceeded after {deadline}s"}}, False
+
+def ensure_plugin_directory():
+    if not plugin_directory.wait_loaded(PLUGIN_DIRECTORY_WAIT):
+        raise ServiceError({"error": "Plugin directory is still loading, try again shortly"}, 503)
+
+def load_plugin(plugin_name: str = None, root_url: str = None):
+    # Initialize the plugin
+    plugin = None
+    if plugin_name:
+        ensure_plugin_directory()
+        plugin_directory.record_use(plugin_name)
+    try:
+        with stage("plugin_resolution", plugin=plugin_name or root_url):
+            if plugin_name:
+                plugin = open_plugin_memo.get_plugin(plugin_name) or open_plugin_memo.init_plugin(plugin_name)
+            elif root_url:
+                plugin = init_root_url_plugin(root_url)
+    except Exception as e:
+        raise ServiceError({"error": str(e)}, 400)
+
+    # Ensure the plugin was initialized successfully and has a manifest
+    if not plugin or not hasattr(plugin, 'manifest'):
+        raise ServiceError({"error": "Failed to initialize the plugin or the plugin lacks a manifest."}, 400)
+
+    return plugin
+
+def generate_stimulous_prompt(plugin) -> str:
+    # Generate the stimulous_prompt using the manifest descriptions
+    generate_stimulation_prompt_prompt = {
+        "prompt": f"""
+        Please create a prompt that will trigger an model's plugin with the human description delimited by driple backticks.
+        If necessary also look at the model description also delimited by triple backticks.
+        Please do not ask anything from the AI you should provide all the information it needs in the prompt.
+        You should not be ambiguous or open ended in your prompt use specific examples.
+        Do not simply restate the description.
+        Human description:
+        ```
+        {plugin.manifest["description_for_human"]}
+        ```
+        Model description:
+        ```
+        {plugin.manifest["description_for_model"]}
+        ```
+        """,
+        "function": {
+            "name": "stimulous_prompt_generation",
+            "description": """
+            Generates a natural language phrase to that triggers the AI plugin.
+            If appropriate the phrase should include an example item/url (https://github.com/)/text/etc. even if you are not sure if it is real its ok to make it up.
+            """,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "stimulous_prompt": {
+                        "type": "string",
+                        "description": "The stimulous phrase to trigger the AI plugin"
+                    },
+                },
+                "required": ["stimulous_prompt"]
+            }
+        }
+    }
+
+    with stage("generate_prompt", plugin=plugin.name):
+        generation = ChatCompletion.create(
+            model="gpt-3.5-turbo-0613",
+            temperature=0.7,
+            messages=[{"role": "user", "content": generate_stimulation_prompt_prompt["prompt"]}],
+            functions=[generate_stimulation_prompt_prompt["function"]],
+            function_call={"name": "stimulous_prompt_generation"}
+        )
+
+    json_arguments = json.loads(generation["choices"][0]["message"]["function_call"]["arguments"])
+    return json_arguments["stimulous_prompt"]
+
+def fit_messages(messages: list, model: str, functions=None, completion_reserve: int = None):
+    # returns (messages, report), the report is None when budgeting is disabled
+    if not TOKEN_BUDGET_ENABLED:
+        return messages, None
+    with stage("token_budget"):
+        reserve = token_budget.function_tokens(functions, model) if functions else 0
+        return token_budget.trim(messages, model, reserve_tokens=reserve, completion_reserve=completion_reserve)
+
+def execute_plugin(data: dict) -> dict:
+    ensure_plugin_directory()
+
+    if not data.get("openplugin_namespace") and not data.get("openplugin_root_url"):
+        raise ServiceError({"error": "Invalid openplugin namespace or root url"}, 400)
+    if data.get("openplugin_namespace") and not open_plugin_memo.plugins_directory.get(data["openplugin_namespace"]):
+        raise ServiceError({"error": "Invalid openplugin namespace"}, 400)
+    if not data.get("messages") or len(data["messages"]) == 0:
+        raise ServiceError({"error": "No messages"}, 400)
+
+    plugin_label = data.get("openplugin_namespace") or data.get("openplugin_root_url")
+    with stage("plugin_resolution", plugin=plugin_label):
+        if data.get("openplugin_namespace"):
+            plugin_directory.record_use(data["openplugin_namespace"])
+            plugin = open_plugin_memo.get_plugin(data["openplugin_namespace"])
+        elif data.get("openplugin_root_url"):
+            try:
+                plugin = init_root_url_plugin(data["openplugin_root_url"])
+            except (urllib.error.URLError, requests.RequestException) as e:
+                # the manifest or spec could not be fetched from the plugin's host
+                error_class = type(e).__name__
+                error_message = str(e)
+                raise ServiceError({"error": f"{error_class} error: {error_message}"}, 502)
+            except Exception as e:
+                error_class = type(e).__name__
+                error_message = str(e)
+                raise ServiceError({"error": f"{error_class} error: {error_message}"}, 400)
+
+        if not plugin:
+            try:
+                plugin = open_plugin_memo.init_plugin(data["openplugin_namespace"])
+            except Exception as e:
+                error_class = type(e).__name__
+                error_message = str(e)
+                raise ServiceError({"error": f"{error_class} error: {error_message}"}, 500)
+
+    plugin = guard_plugin(plugin, data.get("openplugin_namespace") or normalize_root_url(data["openplugin_root_url"]))
+    model = data.get("model", "gpt-3.5-turbo-1106")
+    openai_api_key = data.get("openai_api_key", OPENAI_API_KEY)
+    messages, budget_report = fit_messages(data["messages"], model, plugin.functions)
+
+    try:
+        with stage("fetch_plugin", plugin=plugin_label):
+            plugin_response = upstream.call(
+                plugin.fetch_plugin,
+                messages=messages,
+                truncate=True,
+                plugin_headers=data.get("plugin_headers", None),
+                return_assistant_message=True,
+                model=model,
+                openai_api_key=openai_api_key,
+                temperature=0,
+            )
+    except UpstreamBusy as e:
+        raise ServiceError({"error": f"UpstreamBusy error: {str(e)}"}, 503)
+    except UpstreamTimeout as e:
+        raise ServiceError({"error": f"UpstreamTimeout error: {str(e)}"}, 504)
+    except (urllib.error.URLError, requests.RequestException) as e:
+        # the plugin's own API failed, which is not the caller's fault
+        error_class = type(e).__name__
+        error_message = str(e)
+        raise ServiceError({"error": f"{error_class} error: {error_message}"}, 502)
+    except Exception as e:
+        error_class = type(e).__name__
+        error_message = str(e)
+        plugin_response = {
+            "error": f"{error_class} error: {error_message}"
+        }
+
+    if budget_report is not None:
+        plugin_response["token_budget"] = budget_report
+    return plugin_response
+
+def execute_plugin_cached(data: dict, cache_control: str = None):
+    # returns (plugin_response, cache_status) where cache_status is HIT, MISS, BYPASS or DISABLED
+    if response_cache is None:
+        return execute_plugin(data), "DISABLED"
+
+    directives = {directive.strip().lower() for directive in (cache_control or "").split(",")}
+    bypass = "no-cache" in directives or "no-store" in directives
+    plugin_key = data.get("openplugin_namespace") or normalize_root_url(data.get("openplugin_root_url") or "")
+    # fetch_plugin mutates messages, so the key has to be computed up front
+    key = request_cache_key(plugin_key, data.get("messages"), data.get("model", "gpt-3.5-turbo-1106"), data.get("plugin_headers"))
+
+    if not bypass:
+        cached_response = response_cache.get(key)
+        if cached_response is not None:
+            return cached_response, "HIT"
+
+    plugin_response = execute_plugin(data)
+    if "no-store" not in directives and "error" not in plugin_response:
+        ttl = PLUGIN_RESPONSE_CACHE_TTLS.get(plugin_key, PLUGIN_RESPONSE_CACHE_TTL)
+        response_cache.set(key, plugin_response, ttl, label=plugin_key)
+    return plugin_response, "BYPASS" if bypass else "MISS"
+
+def execute_plugins(data: dict, cache_control: str = None) -> dict:
+    # body: {"openplugin_namespaces": [...], "openplugin_root_urls": [...], "deadline"?: seconds, ...}
+    for field in ("openplugin_namespaces", "openplugin_root_urls"):
+        values = data.get(field) or []
+        if not isinstance(values, list) or not all(isinstance(value, str) and value for value in values):
+            raise ServiceError({"error": f"{field} must be a list of strings"}, 400)
+    targets = [{"openplugin_namespace": namespace} for namespace in data.get("openplugin_namespaces") or []]
+    targets += [{"openplugin_root_url": root_url} for root_url in data.get("openplugin_root_urls") or []]
+    if len(targets) > PLUGIN_MULTI_MAX:
+        raise ServiceError({"error": f"At most {PLUGIN_MULTI_MAX} plugins can be run in one request"}, 400)
+    if not data.get("messages") or len(data["messages"]) == 0:
+        raise ServiceError({"error": "No messages"}, 400)
+    deadline = request_deadline(data, PLUGIN_MULTI_DEADLINE)
+    ensure_plugin_directory()
+
+    shared = {
+        key: value for key, value in data.items()
+        if key not in ("openplugin_namespaces", "openplugin_root_urls", "deadline")
+    }
+
+    def execute_target(target):
+        # fetch_plugin mutates the messages list, so every plugin gets its own
+        target_data = {**shared, **target, "messages": list(data["messages"])}
+        plugin_response, cache_status = execute_plugin_cached(target_data, cache_control)
+        return {"status_code": 200, "cache": cache_status, "plugin_response": plugin_response}
+
+    start = time.perf_counter()
+    results = []
+    timed_out = 0
+    for index, outcome, finished in fan_out(targets, execute_target, len(targets), deadline, "plugin-multi"):
+        results.append({**targets[index], **outcome})
+        timed_out += not finished
+    return {
+        "results": results,
+        "completed": len(targets) - timed_out,
+        "timed_out": timed_out,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+def evaluate_supported_plugin(plugin_name: str = None, root_url: str = None, prompt: str = None):
+    timings = {}
+    try:
+        # Ensure that either plugin_name or root_url is provided
+        if not plugin_name and not root_url:
+            return {
+                "prompt": prompt,
+                "plugin_response": {"error": "Either plugin_name or root_url must be provided"},
+                "timings": timings,
+            }, 400
+
+        # If no prompt is provided, generate one from the plugin manifest
+        if not prompt:
+            start = time.perf_counter()
+            plugin = load_plugin(plugin_name, root_url)
+            timings["manifest_ms"] = round((time.perf_counter() - start) * 1000, 1)
 
-    token_info = request_data[early_access_token]
+            start = time.perf_counter()
+            prompt, _ = stimulus_prompts.get(plugin)
+            timings["generate_prompt_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info("generated prompt: %s", prompt)
 
-    print(f"Request from \"{early_access_token}\" with plugin \"{plugin_name}\"")
+        # Transform the prompt into a message and run it against the plugin
+        data = {
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if plugin_name:
+            data["openplugin_namespace"] = plugin_name
+        else:
+            data["openplugin_root_url"] = root_url
 
-    # Filter out requests that are older than a day from the token bucket
-    valid_requests = [req for req in token_info["bucket"] if (now - req["date_sent"]).total_seconds() < 86400]
+        start = time.perf_counter()
+        plugin_response, _ = execute_plugin_cached(data)
+        timings["plugin_ms"] = round((time.perf_counter() - start) * 1000, 1)
 
-    # Update the token bucket with valid requests
-    token_info["bucket"] = valid_requests
+        # extract the attribute function_message from the plugin response
+        if plugin_response.get('function_message', {}):
+            plugin_response = plugin_response.get('function_message', {})
+        return {
+            "prompt": prompt,
+            "plugin_response": plugin_response,
+            "timings": timings,
+        }, 200
 
-    # Check the length of valid requests
-    if len(valid_requests) < MAX_REQUESTS_PER_DAY:
-        valid_requests.append({
-            "date_sent": now,
-            "plugin_name": plugin_name
+    except ServiceError as e:
+        return {
+            "prompt": prompt,
+            "plugin_response": e.body,
+            "timings": timings,
+        }, e.status_code
+    except Exception as e:
+        error_class = type(e).__name__
+        error_message = str(e)
+        return {
+            "prompt": prompt,
+            "plugin_response": {
+                "error": f"{error_class} error: {error_message}"
+            },
+            "timings": timings,
+        }, 500
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat_completion(plugin_name: str, messages: list, chatgpt_args: dict):
+    # Same pipeline as openplugin_completion, but every stage boundary is sent
+    # to the client as soon as it is reached instead of after the final answer.
+    # Events, in order:
+    #   plugin_loaded    the plugin is resolved; its functions and the token budget
+    #   plugin_response  the model called one of the functions, with the plugin's answer
+    #   plugin_skipped   instead of plugin_response when the model called no function
+    #   delta            one per chunk of the final assistant message
+    #   done | error
+    try:
+        plugin = guard_plugin(load_plugin(plugin_name), plugin_name)
+        messages, budget_report = fit_messages(
+            messages,
+            chatgpt_args.get("model", "gpt-3.5-turbo-1106"),
+            plugin.functions,
+            completion_reserve=chatgpt_args.get("max_tokens"),
+        )
+        yield sse_event("plugin_loaded", {
+            "plugin_name": plugin.name,
+            "functions": [function["name"] for function in plugin.functions],
+            "token_budget": budget_report,
         })
-        token_info["total_use"] += 1
-        return True
 
-    return False
+        try:
+            # fetch_plugin removes the system message from the list it is given
+            function_message = upstream.call(
+                plugin.fetch_plugin,
+                messages=list(messages),
+                truncate=True,
+                openai_api_key=OPENAI_API_KEY,
+                **chatgpt_args,
+            )
+            yield sse_event("plugin_response", function_message)
+            messages = messages + [function_message]
+        except ValueError as e:
+            if "Not a plugin function" not in str(e):
+                raise e
+            yield sse_event("plugin_skipped", {"reason": str(e)})
+
+        finish_reason = None
+        for chunk in ChatCompletion.create(
+            api_key=OPENAI_API_KEY,
+            messages=messages,
+            stream=True,
+            request_timeout=UPSTREAM_TIMEOUT,
+            **chatgpt_args,
+        ):
+            choice = chunk["choices"][0]
+            content = choice.get("delta", {}).get("content")
+            if content:
+                yield sse_event("delta", {"content": content})
+            finish_reason = choice.get("finish_reason") or finish_reason
+        yield sse_event("done", {"finish_reason": finish_reason})
+
+    except ServiceError as e:
+        yield sse_event("error", e.body)
+    except Exception as e:
+        error_class = type(e).__name__
+        error_message = str(e)
+        yield sse_event("error", {"error": f"{error_class} error: {error_message}"})
 
 @app.route('/chat_completion', methods=['POST'])
 def chat_completion():
     try:
-        data = request.get_json()
+        with stage("parse"):
+            data = request.get_json()
 
         early_access_token = data.get('early_access_token', None)
         if not early_access_token:
             raise Exception("early_access_token is missing")
-        if early_access_token not in request_data:
+        if early_access_token not in early_access_tokens:
             raise Exception("early_access_token is invalid")
         if not rate_limiter_pass(early_access_token, data["plugin_name"]):
             raise Exception("Rate limit exceeded")
@@ -102,15 +777,46 @@ def chat_completion():
         
         # delete messages from chatgpt_args
         del chatgpt_args["messages"]
+
+        if chatgpt_args.pop("stream", False):
+            return Response(
+                stream_with_context(stream_chat_completion(plugin_name, messages, chatgpt_args)),
+                mimetype='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
         
-        response = openplugin_completion(
-            openai_api_key=OPENAI_API_KEY,
-            plugin_name=plugin_name,
-            messages=messages,
-            **chatgpt_args,
+        # the plugin is only looked up, not loaded, so an unknown plugin still fails in openplugin_completion
+        known_plugin = open_plugin_memo.get_plugin(plugin_name)
+        if known_plugin:
+            # openplugin_completion builds its own plugin, so its API calls can't be timed
+            # here; an open breaker still turns the request away
+            plugin_health.breaker(plugin_name).allow(plugin_name, probe=False)
+        messages, budget_report = fit_messages(
+            messages,
+            chatgpt_args.get("model", "gpt-3.5-turbo-1106"),
+            known_plugin.functions if known_plugin else None,
+            completion_reserve=chatgpt_args.get("max_tokens"),
         )
-        return jsonify(response)
 
+        with stage("openplugin_completion", plugin=plugin_name):
+            response = upstream.call(
+                openplugin_completion,
+                openai_api_key=OPENAI_API_KEY,
+                plugin_name=plugin_name,
+                messages=messages,
+                **chatgpt_args,
+            )
+        if budget_report is not None:
+            response["token_budget"] = budget_report
+        with stage("serialize", plugin=plugin_name):
+            return jsonify(response)
+
+    except UpstreamBusy as e:
+        return jsonify({"error": f"UpstreamBusy error: {str(e)}"}), 503
+    except UpstreamTimeout as e:
+        return jsonify({"error": f"UpstreamTimeout error: {str(e)}"}), 504
+    except CircuitOpen as e:
+        return jsonify({"error": f"CircuitOpen error: {str(e)}"}), 503, {"Retry-After": str(round(e.retry_after))}
     except Exception as e:
         error_class = type(e).__name__
         error_message = str(e)
@@ -124,51 +830,20 @@ def plugin():
     if authorization != os.getenv('AUTHORIZATION_SECRET'):
         return jsonify({"error": "Unauthorized"}), 401    
 
-    if not open_plugin_memo.plugins_directory:
-        open_plugin_memo.init()
-    # get the body
-    data = request.get_json()
-    
-    if not data.get("openplugin_namespace") and not data.get("openplugin_root_url"):
-        return jsonify({"error": "Invalid openplugin namespace or root url"}), 400
-    if data.get("openplugin_namespace") and not open_plugin_memo.plugins_directory[data["openplugin_namespace"]]:
-        return jsonify({"error": "Invalid openplugin namespace"}), 
-    if not data["messages"] or len(data["messages"]) == 0:
-        return jsonify({"error": "No messages"}), 400
-    
-    if data.get("openplugin_namespace"):
-        plugin = open_plugin_memo.get_plugin(data["openplugin_namespace"])
-    elif data.get("openplugin_root_url"):
-        plugin = open_plugin_memo.init_openplugin(root_url=data["openplugin_root_url"])
-
-    model = data.get("model", "gpt-3.5-turbo-1106")
-    openai_api_key = data.get("openai_api_key", OPENAI_API_KEY)
-
-    if not plugin:
-        try:
-            plugin = open_plugin_memo.init_plugin(data["openplugin_namespace"])
-        except Exception as e:
-            error_class = type(e).__name__
-            error_message = str(e)
-            return jsonify({"error": f"{error_class} error: {error_message}"}), 500
     try:
-        plugin_response = plugin.fetch_plugin(
-            messages=data["messages"],
-            truncate=True,
-            plugin_headers=data.get("plugin_headers", None),
-            return_assistant_message=True,
-            model=model,
-            openai_api_key=openai_api_key,
-            temperature=0,
-        )
-    except Exception as e:
-        error_class = type(e).__name__
-        error_message = str(e)
-        plugin_response = {
-            "error": f"{error_class} error: {error_message}"
-        }
+        with stage("parse"):
+            data = request.get_json()
+        if data.get("openplugin_namespaces") or data.get("openplugin_root_urls"):
+            plugin_responses = execute_plugins(data, request.headers.get('Cache-Control'))
+            with stage("serialize"):
+                return jsonify(plugin_responses), 200
+        plugin_response, cache_status = execute_plugin_cached(data, request.headers.get('Cache-Control'))
+    except ServiceError as e:
+        return jsonify(e.body), e.status_code, e.headers
+
+    with stage("serialize", plugin=data.get("openplugin_namespace") or data.get("openplugin_root_url")):
+        return jsonify(plugin_response), 200, {"X-Cache": cache_status}
 
-    return jsonify(plugin_response), 200
 
 @app.route('/eval/tentative', methods=['GET'])
 def evaluate_tentative():
@@ -183,47 +858,28 @@ def evaluate_tentative():
         if not plugin_name and not root_url:
             return jsonify({"error": "Either plugin_name or root_url must be provided"}), 400
 
-        # Initialize the plugin
-        plugin = None
+        # Resolve the plugin's root url without initializing the plugin itself
+        if plugin_name:
+            ensure_plugin_directory()
+            root_url = open_plugin_memo.plugins_directory.get(plugin_name)
+            if not root_url:
+                return jsonify({"error": "Plugin not found"}), 400
+        root_url = normalize_root_url(root_url)
+
+        # Validate the manifest and OpenAPI spec (memoized by their content)
         try:
-            if plugin_name:
-                plugin = open_plugin_memo.get_plugin(plugin_name)
-            elif root_url:
-                plugin = open_plugin_memo.init_openplugin(root_url=root_url)
+            with stage("manifest_validation", plugin=plugin_name or root_url):
+                etag, openplugin_info, status_code, cached = manifest_validator.evaluate(root_url)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-        # Ensure the plugin was initialized successfully and has a manifest
-        if not plugin or not hasattr(plugin, 'manifest'):
-            return jsonify({"error": "Failed to initialize the plugin or the plugin lacks a manifest."}), 400
-
-        # Retrieve the manifest from the plugin
-        manifest = plugin.manifest
-
-        # Extract the relevant openplugin_info values from the manifest
-        openplugin_info = {
-            "namespace": manifest.get("name_for_model"),
-            "image": manifest.get("logo_url"),
-            "description_for_human": manifest.get("description_for_human"),
-            "description_for_model": manifest.get("description_for_model"),
-            "domain": plugin.root_url,
-            "openapi_url": manifest.get("api", {}).get("url"),
-            "auth": manifest.get("auth"),
-            "blacklisted": False,
-            "whitelisted": True,
-            "stimulous_prompt": None,  # This will be populated later
-            "stimulated": False,
-            "status": "tentative"
-        }
-
-        # Ensure all required values are present in the openplugin_info
-        required_keys = ["namespace", "description_for_human", "description_for_model", "domain", "auth", "image", "openapi_url"]
-        for key in required_keys:
-            if not openplugin_info.get(key):
-                return jsonify({"error": f"Missing value for {key} in the manifest."}), 400
-
-        return jsonify(openplugin_info), 200
+        headers = {"ETag": etag, "X-Cache": "HIT" if cached else "MISS"}
+        if not_modified(etag, status_code, request.headers.get('If-None-Match')):
+            return '', 304, headers
+        return jsonify(openplugin_info), status_code, headers
 
+    except ServiceError as e:
+        return jsonify(e.body), e.status_code, e.headers
     except Exception as e:
         error_class = type(e).__name__
         error_message = str(e)
@@ -231,81 +887,113 @@ def evaluate_tentative():
     
 @app.route('/eval/supported', methods=['GET'])
 def evaluate_supported():
+    # Retrieve the plugin_name, root_url, and prompt from the request parameters
+    plugin_name = request.args.get('plugin_name')
+    root_url = request.args.get('root_url')
+    prompt = request.args.get('prompt')
+    if root_url:
+        root_url = unquote(root_url)
+    if prompt:
+        prompt = unquote(prompt)
+
     authorization = request.headers.get('authorization')
     if authorization != os.getenv('AUTHORIZATION_SECRET'):
         return jsonify({
             "prompt": prompt,
             "plugin_response": {"error": "Unauthorized"},
         }), 401
-    
-    headers = {'authorization': authorization}
-    
-    try:
-        # Retrieve the plugin_name, root_url, and prompt from the request parameters
-        plugin_name = request.args.get('plugin_name')
-        root_url = request.args.get('root_url')
-        prompt = request.args.get('prompt')
-        if root_url:
-            root_url = unquote(root_url)
-        if prompt:
-            prompt = unquote(prompt)
 
-        # Ensure that either plugin_name or root_url is provided
-        if not plugin_name and not root_url:
-            return jsonify({
-                "prompt": prompt,
-                "plugin_response": {"error": "Either plugin_name or root_url must be provided"},
-            }), 400
+    result, status_code = evaluate_supported_plugin(plugin_name, root_url, prompt)
+    return jsonify(result), status_code
 
-        # If no prompt is provided, get one from the /generate_prompt endpoint
-        if not prompt:
-            with app.test_client() as client:
-                if plugin_name:
-                    response = client.get(f'/generate_prompt?plugin_name={plugin_name}', headers=headers)
-                else:
-                    response = client.get(f'/generate_prompt?root_url={quote(root_url)}', headers=headers)
-                if response.status_code == 200:
-                    prompt = response.json.get('stimulous_prompt')
-                    print("generated prompt: ", prompt)
-                else:
-                    return jsonify({
-                        "prompt": prompt,
-                        "plugin_response": response.json,
-                    }), response.status_code
-
-        # Transform the prompt into a message and send it to the /plugin endpoint
-        data = {
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        if plugin_name:
-            data["openplugin_namespace"] = plugin_name
-        else:
-            data["openplugin_root_url"] = root_url
+def evaluate_plugins(items: list, concurrency: int, deadline: float):
+    # the sweep behind /eval/batch and /eval/supported/batch;
+    # items: [{"plugin_name" | "root_url", "prompt"?}], yields like fan_out
+    def evaluate_item(item):
+        result, status_code = evaluate_supported_plugin(item.get("plugin_name"), item.get("root_url"), item.get("prompt"))
+        return {"status_code": status_code, **result}
 
-        with app.test_client() as client:
-            response = client.post('/plugin', json=data, headers=headers)
-            # get the response json and then extract the attribute function_message from it
-            response_to_return = response.json
-            if response_to_return.get('function_message', {}):
-                response_to_return = response_to_return.get('function_message', {})
-            return jsonify({
-                "prompt": prompt,
-                "plugin_response": response_to_return,
-            }), response.status_code
+    return fan_out(items, evaluate_item, concurrency, deadline, "eval-batch")
 
-    except Exception as e:
-        error_class = type(e).__name__
-        error_message = str(e)
-        return jsonify({
-            "prompt": prompt,
-            "plugin_response": {
-                "error": f"{error_class} error: {error_message}"
-            }
-        }), 500
+@app.route('/eval/supported/batch', methods=['POST'])
+def evaluate_supported_batch():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # body: {"plugins": [{"plugin_name" | "root_url", "prompt"?}, ...], "deadline"?: seconds}
+    data = request.get_json()
+    plugins = data.get("plugins") if data else None
+    if not plugins or not isinstance(plugins, list) or not all(isinstance(item, dict) for item in plugins):
+        return jsonify({"error": "plugins must be a non-empty list of objects"}), 400
+    try:
+        deadline = request_deadline(data, EVAL_BATCH_DEADLINE)
+    except ServiceError as e:
+        return jsonify(e.body), e.status_code, e.headers
+
+    # items run in parallel, results keep the order of the request
+    start = time.perf_counter()
+    results = [None] * len(plugins)
+    timed_out = 0
+    for index, outcome, finished in evaluate_plugins(plugins, EVAL_BATCH_MAX_CONCURRENCY, deadline):
+        item = plugins[index]
+        results[index] = {"plugin_name": item.get("plugin_name"), "root_url": item.get("root_url"), **outcome}
+        timed_out += not finished
+
+    return jsonify({
+        "results": results,
+        "completed": len(plugins) - timed_out,
+        "timed_out": timed_out,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }), 200
+
+@app.route('/eval/batch', methods=['POST'])
+def evaluate_batch():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # body: {"namespaces": [...], "root_urls": [...], "concurrency"?: int, "deadline"?: seconds}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    for field in ("namespaces", "root_urls"):
+        values = data.get(field) or []
+        if not isinstance(values, list) or not all(isinstance(value, str) and value for value in values):
+            return jsonify({"error": f"{field} must be a list of strings"}), 400
+    items = [{"plugin_name": namespace} for namespace in data.get("namespaces") or []]
+    items += [{"root_url": root_url} for root_url in data.get("root_urls") or []]
+    if not items:
+        return jsonify({"error": "Either namespaces or root_urls must be provided"}), 400
+    concurrency = data.get("concurrency", EVAL_BATCH_MAX_CONCURRENCY)
+    # bool is an int subclass, but "concurrency": true is not a number of workers
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    concurrency = max(1, min(concurrency, EVAL_BATCH_MAX_CONCURRENCY))
+    try:
+        deadline = request_deadline(data, EVAL_BATCH_DEADLINE)
+    except ServiceError as e:
+        return jsonify(e.body), e.status_code, e.headers
+
+    # stream one NDJSON line per plugin in completion order, then a summary line
+    def generate():
+        start = time.perf_counter()
+        timed_out = 0
+        for index, outcome, finished in evaluate_plugins(items, concurrency, deadline):
+            timed_out += not finished
+            yield json.dumps({**items[index], **outcome}) + "\n"
+        yield json.dumps({
+            "done": True,
+            "count": len(items),
+            "timed_out": timed_out,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
     
 @app.route('/generate_prompt', methods=['GET'])
 def generate_prompt():
-    print("GENERATE PROMPT")
+    logger.debug("GENERATE PROMPT")
     authorization = request.headers.get('authorization')
     if authorization != os.getenv('AUTHORIZATION_SECRET'):
         return jsonify({"error": "Unauthorized"}), 401 
@@ -321,69 +1009,15 @@ def generate_prompt():
         if not plugin_name and not root_url:
             return jsonify({"error": "Either plugin_name or root_url must be provided"}), 400
 
-        # Initialize the plugin
-        plugin = None
-        try:
-            if plugin_name:
-                plugin = open_plugin_memo.get_plugin(plugin_name)
-            elif root_url:
-                plugin = open_plugin_memo.init_openplugin(root_url=root_url)
-        except Exception as e:
-            return jsonify({"error": str(e)}), 400
+        plugin = load_plugin(plugin_name, root_url)
+        # ?fresh=true skips the pool, the new prompt is still added to it
+        fresh = request.args.get('fresh', '').lower() in ('1', 'true')
+        stimulous_prompt, source = stimulus_prompts.get(plugin, fresh=fresh)
 
-        # Ensure the plugin was initialized successfully and has a manifest
-        if not plugin or not hasattr(plugin, 'manifest'):
-            return jsonify({"error": "Failed to initialize the plugin or the plugin lacks a manifest."}), 400
-
-        # Generate the stimulous_prompt using the manifest descriptions
-        generate_stimulation_prompt_prompt = {
-            "prompt": f"""
-            Please create a prompt that will trigger an model's plugin with the human description delimited by driple backticks.
-            If necessary also look at the model description also delimited by triple backticks.
-            Please do not ask anything from the AI you should provide all the information it needs in the prompt.
-            You should not be ambiguous or open ended in your prompt use specific examples.
-            Do not simply restate the description.
-            Human description:
-            ```
-            {plugin.manifest["description_for_human"]}
-            ```
-            Model description:
-            ```
-            {plugin.manifest["description_for_model"]}
-            ```
-            """,
-            "function": {
-                "name": "stimulous_prompt_generation",
-                "description": """
-                Generates a natural language phrase to that triggers the AI plugin.
-                If appropriate the phrase should include an example item/url (https://github.com/)/text/etc. even if you are not sure if it is real its ok to make it up.
-                """,
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "stimulous_prompt": {
-                            "type": "string",
-                            "description": "The stimulous phrase to trigger the AI plugin"
-                        },
-                    },
-                    "required": ["stimulous_prompt"]
-                }
-            }
-        }
-
-        generation = ChatCompletion.create(
-            model="gpt-3.5-turbo-0613",
-            temperature=0.7,
-            messages=[{"role": "user", "content": generate_stimulation_prompt_prompt["prompt"]}],
-            functions=[generate_stimulation_prompt_prompt["function"]],
-            function_call={"name": "stimulous_prompt_generation"}
-        )
-
-        json_arguments = json.loads(generation["choices"][0]["message"]["function_call"]["arguments"])
-        stimulous_prompt = json_arguments["stimulous_prompt"]
-
-        return jsonify({"stimulous_prompt": stimulous_prompt}), 200
+        return jsonify({"stimulous_prompt": stimulous_prompt}), 200, {"X-Prompt-Source": source}
 
+    except ServiceError as e:
+        return jsonify(e.body), e.status_code, e.headers
     except Exception as e:
         error_class = type(e).__name__
         error_message = str(e)
@@ -391,6 +1025,7 @@ def generate_prompt():
     
 
 
+
 @app.route('/oauth_initialization', methods=['GET'])
 def oauth_initialization():
     try:
@@ -402,8 +1037,9 @@ def oauth_initialization():
         openplugin_callback_url = unquote(request.args.get('openplugin_callback_url', ''))
         authorization_content_type = unquote(request.args.get('authorization_content_type', ''))
 
-        # Fetch the item from the 'openplugin-auth' collection using the client_domain
-        item = db["openplugin-auth"].find_one({"domain": client_domain})
+        # Fetch the item from the 'openplugin-auth' collection (read-through cache) using the client_domain
+        with stage("mongo_lookup", plugin=client_domain):
+            item = oauth_clients.get(client_domain)
         if not item:
             return jsonify({"error": "Item not found"}), 404
 
@@ -412,21 +1048,25 @@ def oauth_initialization():
         if not client_id:
             return jsonify({"error": "Client ID not found"}), 404
 
-        # Generate a unique state value for this request
+        # Generate a unique state value for this request, and reuse the browser's
+        # nonce so concurrent flows from the same browser all stay redeemable
         state = os.urandom(16).hex()
-
-        # Store these parameters in the session under the state key
-        session[state] = {
-            "client_id": client_id,
-            "client_domain": client_domain,
-            "authorization_url": authorization_url,
-            "token_url": token_url,
-            "scope": scope,
-            "openplugin_callback_url": openplugin_callback_url,
-            "authorization_content_type": authorization_content_type
-        }
-
-        # Initialize the client with the retrieved client_id
+        nonce = request.cookies.get(OAUTH_NONCE_COOKIE) or os.urandom(16).hex()
+
+        # Store these parameters in the state store under the state key
+        with stage("oauth_state", plugin=client_domain):
+            oauth_states.put(state, {
+                "client_id": client_id,
+                "client_domain": client_domain,
+                "authorization_url": authorization_url,
+                "token_url": token_url,
+                "scope": scope,
+                "openplugin_callback_url": openplugin_callback_url,
+                "authorization_content_type": authorization_content_type
+            }, nonce)
+
+        # Initialize the client with the retrieved client_id (oauthlib is only imported once OAuth is used)
+        from oauthlib.oauth2 import WebApplicationClient
         client = WebApplicationClient(client_id)
 
         # Construct the redirect_url to point to the /oauth_token endpoint of the same Flask API
@@ -442,7 +1082,16 @@ def oauth_initialization():
         )
 
         # Redirect the user to the authorization_url
-        return redirect(authorization_url)
+        response = redirect(authorization_url)
+        response.set_cookie(
+            OAUTH_NONCE_COOKIE,
+            nonce,
+            max_age=int(OAUTH_STATE_TTL),
+            httponly=True,
+            samesite='Lax',
+            secure=request.is_secure,
+        )
+        return response
 
     except Exception as e:
         error_class = type(e).__name__
@@ -457,13 +1106,17 @@ def oauth_token():
         state = request.args.get('state')
         code = request.args.get('code')
 
-        # Retrieve the session using the state
-        session_data = session.get(state)
+        # Retrieve and consume the flow stored under the state, so it can only be redeemed once
+        session_data = None
+        if state:
+            with stage("oauth_state"):
+                session_data = oauth_states.consume(state, request.cookies.get(OAUTH_NONCE_COOKIE))
         if not session_data:
             return jsonify({"error": "Invalid state"}), 400
 
-        # Fetch the item from the 'openplugin-auth' collection using the client_domain
-        item = db["openplugin-auth"].find_one({"domain": session_data["client_domain"]})
+        # Fetch the item from the 'openplugin-auth' collection (read-through cache) using the client_domain
+        with stage("mongo_lookup", plugin=session_data["client_domain"]):
+            item = oauth_clients.get(session_data["client_domain"])
         if not item:
             return jsonify({"error": "Item not found"}), 404
 
@@ -473,6 +1126,7 @@ def oauth_token():
             return jsonify({"error": "Client secret not found"}), 404
 
         # Initialize the client with the provided client_id
+        from oauthlib.oauth2 import WebApplicationClient
         client = WebApplicationClient(session_data["client_id"])
 
         # Prepare the token request
@@ -497,7 +1151,7 @@ def oauth_token():
             token_data = json.dumps(data_dict)
 
         # Make the POST request to the token_url
-        token_response = requests.post(
+        token_response = outbound.post(
             token_url,
             headers={**headers, **token_request_headers},
             data=token_data
@@ -514,9 +1168,6 @@ def oauth_token():
         }
         redirect_url = f"{session_data['openplugin_callback_url']}?{urlencode(params)}"
 
-        # cleanup session
-        del session[state]
-
         return redirect(redirect_url)
 
     except Exception as e:
@@ -531,16 +1182,75 @@ def admin_view():
         authorization = request.headers.get('authorization')
         if authorization != os.getenv('AUTHORIZATION_SECRET'):
             return jsonify({"error": "Unauthorized"}), 401  
-        return jsonify(request_data)
+        if usage_ledger is not None:
+            return jsonify({token: usage_ledger.summary(token) for token in early_access_tokens})
+        return jsonify({token: rate_limiter.usage(token) for token in early_access_tokens})
     except Exception as e:
         error_class = type(e).__name__
         error_message = str(e)
         return jsonify({"error": f"{error_class} error: {error_message}"}), 403
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # scrapers authenticate with the admin secret or with `Bearer $METRICS_TOKEN`
+    authorization = request.headers.get('authorization')
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if authorization != os.getenv('AUTHORIZATION_SECRET') and not (metrics_token and authorization == f"Bearer {metrics_token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # load balancer readiness probe: 200 only once the directory and warm plugins are loaded
+    status = plugin_directory.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route('/admin/http', methods=['GET'])
+def admin_http():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(outbound.stats())
+
+
+@app.route('/admin/admission', methods=['GET'])
+def admin_admission():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(admission.stats())
+
+
+@app.route('/admin/plugins', methods=['GET'])
+def admin_plugins():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(plugin_health.stats())
+
+
+@app.route('/admin/caches', methods=['GET'])
+def admin_caches():
+    authorization = request.headers.get('authorization')
+    if authorization != os.getenv('AUTHORIZATION_SECRET'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "plugins": plugin_cache.stats(),
+        "plugin_responses": response_cache.stats() if response_cache else None,
+        "oauth_clients": oauth_clients.stats(),
+        "stimulus_prompts": stimulus_prompts.stats(),
+        "usage_ledger": usage_ledger.stats() if usage_ledger else None,
+        "manifests": manifest_validator.stats(),
+    })
+
+
 on_heroku = 'DYNO' in os.environ
 
 if __name__ == '__main__':
+    start_background_services()
     if on_heroku:
         app.run(host='0.0.0.0', port=PORT)
     else:
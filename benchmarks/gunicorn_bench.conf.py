@@ -0,0 +1,35 @@
+# gunicorn config used by the benchmarks: the repo config plus the plugin
+# directory redirected to the local stub server and, unless BENCH_MONGO=uri,
+# MongoDB replaced by mongomock.
+import os
+import runpy
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+globals().update({
+    key: value
+    for key, value in runpy.run_path(os.path.join(os.path.dirname(BENCH_DIR), 'gunicorn.conf.py')).items()
+    if not key.startswith('__')
+})
+loglevel = 'warning'
+
+from stubs import redirect_plugin_directory, seed_oauth_client
+
+redirect_plugin_directory(os.environ['STUB_URL'])
+
+if os.getenv('BENCH_MONGO', 'mongomock') == 'mongomock':
+    # patched in the master so every worker imports the app against mongomock
+    import mongomock
+    import pymongo
+
+    pymongo.MongoClient = mongomock.MongoClient
+
+    _repo_post_worker_init = globals().get('post_worker_init')
+
+    def post_worker_init(worker):
+        # mongomock data is private to each worker, so each one gets the seed
+        if _repo_post_worker_init:
+            _repo_post_worker_init(worker)
+        seed_oauth_client(sys.modules['app'].db)
@@ -0,0 +1,216 @@
+# Load test comparing sync gunicorn workers with the threaded build.
+#
+#   python benchmarks/load_test.py --requests 200 --concurrency 50 --latency 0.5
+#
+# Starts the stub OpenAI/plugin server, boots the app under gunicorn once per
+# worker class and reports requests/sec and latency percentiles per route.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import STUB_NAMESPACE, STUB_OAUTH_DOMAIN, start_stub_server
+
+AUTHORIZATION_SECRET = 'bench-secret'
+EARLY_ACCESS_TOKEN = '__extra__-c22a34e2-89a8-48b2-8474-c664b577526b'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def route_request(route: str, stub_url: str):
+    if route == 'plugin':
+        return 'post', '/plugin', {
+            "json": {
+                "openplugin_namespace": STUB_NAMESPACE,
+                "messages": [{"role": "user", "content": "What is on my todo list?"}],
+            },
+            "headers": {"authorization": AUTHORIZATION_SECRET},
+        }
+    if route == 'chat_completion':
+        return 'post', '/chat_completion', {
+            "json": {
+                "early_access_token": EARLY_ACCESS_TOKEN,
+                "plugin_name": STUB_NAMESPACE,
+                "model": "gpt-3.5-turbo-1106",
+                "messages": [{"role": "user", "content": "What is on my todo list?"}],
+            },
+        }
+    if route == 'eval_tentative':
+        return 'get', '/eval/tentative', {"params": {"root_url": stub_url}}
+    if route == 'eval_supported':
+        return 'get', '/eval/supported', {
+            "params": {"plugin_name": STUB_NAMESPACE},
+            "headers": {"authorization": AUTHORIZATION_SECRET},
+        }
+    raise ValueError(f"Unknown route \"{route}\"")
+
+
+def oauth_round_trip(session, base_url: str, stub_url: str) -> int:
+    # /oauth_initialization redirects to the provider with a state, which /oauth_token then redeems
+    response = session.get(f"{base_url}/oauth_initialization", allow_redirects=False, timeout=120, params={
+        "client_domain": STUB_OAUTH_DOMAIN,
+        "authorization_url": f"{stub_url}/oauth/authorize",
+        "token_url": f"{stub_url}/oauth/token",
+        "scope": "todos",
+        "openplugin_callback_url": f"{stub_url}/oauth/callback",
+        "authorization_content_type": "application/json",
+    })
+    if response.status_code != 302:
+        return response.status_code
+    state = parse_qs(urlsplit(response.headers["Location"]).query)["state"][0]
+    response = session.get(f"{base_url}/oauth_token", params={"state": state, "code": "stub-code"}, allow_redirects=False, timeout=120)
+    return 200 if response.status_code == 302 else response.status_code
+
+
+def worker_rss_mb(process) -> dict:
+    # resident memory of the gunicorn workers (Linux only, None elsewhere)
+    try:
+        with open(f"/proc/{process.pid}/task/{process.pid}/children") as children:
+            pids = children.read().split()
+        rss = []
+        for pid in pids:
+            with open(f"/proc/{pid}/status") as status:
+                rss.extend(int(line.split()[1]) / 1024 for line in status if line.startswith("VmRSS:"))
+    except OSError:
+        return None
+    return {"workers": len(rss), "total_mb": round(sum(rss), 1), "max_mb": round(max(rss, default=0), 1)}
+
+
+def app_env(stub_url: str, port: int, worker_class: str = 'gthread', workers: int = 1, threads: int = 8, extra_env=None) -> dict:
+    return {
+        **os.environ,
+        "STUB_URL": stub_url,
+        "OPENAI_API_BASE": f"{stub_url}/v1",
+        "OPENAI_API_KEY": "sk-bench",
+        "AUTHORIZATION_SECRET": AUTHORIZATION_SECRET,
+        "SESSION_SECRET": "bench",
+        "PORT": str(port),
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "WEB_CONCURRENCY": str(workers),
+        # gunicorn silently switches sync workers to gthread when threads > 1
+        "GUNICORN_THREADS": str(threads if worker_class != 'sync' else 1),
+        # oauthlib refuses plain http redirect and token URLs otherwise
+        "DEVELOPMENT": "1",
+        **(extra_env or {}),
+    }
+
+
+def spawn_app(stub_url: str, worker_class: str, workers: int, threads: int, extra_env=None):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BENCH_DIR, 'gunicorn_bench.conf.py'),
+         '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=REPO_DIR,
+        env=app_env(stub_url, port, worker_class, workers, threads, extra_env),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_for(url: str, timeout: float = 60, headers=None) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, headers=headers, timeout=5).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def start_app(stub_url: str, worker_class: str, workers: int, threads: int, extra_env=None):
+    process, base_url = spawn_app(stub_url, worker_class, workers, threads, extra_env)
+    if wait_for(f"{base_url}/ready"):
+        return process, base_url
+    process.kill()
+    raise RuntimeError("The app did not start within 60 seconds")
+
+
+def drive(base_url: str, route: str, stub_url: str, total: int, concurrency: int) -> dict:
+    # one keep-alive session per client thread, like one browser per user; this
+    # also keeps a client's OAuth round trip on the worker that started it
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        if route == 'oauth':
+            status = oauth_round_trip(session, base_url, stub_url)
+        else:
+            method, path, kwargs = route_request(route, stub_url)
+            status = session.request(method, f"{base_url}{path}", timeout=120, **kwargs).status_code
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "route": route,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, status in results if status >= 400),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds the stub OpenAI and plugin APIs take to answer')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--routes', default='plugin,chat_completion')
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.latency)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    results = []
+    for worker_class in ('sync', 'gthread'):
+        process, base_url = start_app(stub_url, worker_class, args.workers, args.threads)
+        try:
+            for route in args.routes.split(','):
+                # the early access token allows 200 requests a day per worker
+                total = min(args.requests, 200) if route == 'chat_completion' else args.requests
+                results.append({"worker_class": worker_class, **drive(base_url, route, stub_url, total, args.concurrency)})
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
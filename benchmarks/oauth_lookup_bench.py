@@ -0,0 +1,67 @@
+# Per-request cost of the OAuth client-config lookup, uncached vs cached.
+#
+#   python benchmarks/oauth_lookup_bench.py                       # mongomock
+#   python benchmarks/oauth_lookup_bench.py --mongodb-uri mongodb://localhost:27017
+#
+# Seeds an `openplugin-auth` collection with client configs, then times the
+# raw find_one the routes used to run on every hop against OAuthClientConfigs.
+# mongomock ignores indexes, so point it at a real mongod to see the index win.
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oauth_store import OAuthClientConfigs
+
+
+def time_lookups(lookup, domains, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        lookup(random.choice(domains))
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongodb-uri', default=None)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--hot-domains', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongodb_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    collection = client["openplugin-bench"]["openplugin-auth"]
+    collection.drop()
+    collection.insert_many([
+        {"domain": f"plugin-{index}.example.com", "oauth": {"client_id": f"id-{index}", "client_secret": f"secret-{index}"}}
+        for index in range(args.clients)
+    ])
+    domains = [f"plugin-{index}.example.com" for index in range(args.hot_domains)]
+
+    results = {"find_one without index (us)": time_lookups(lambda domain: collection.find_one({"domain": domain}), domains, args.rounds)}
+
+    configs = OAuthClientConfigs(collection, ttl=300, max_entries=1024)
+    configs.ensure_indexes()
+    results["find_one with unique index (us)"] = time_lookups(lambda domain: collection.find_one({"domain": domain}), domains, args.rounds)
+    start = time.perf_counter()
+    for domain in domains:
+        configs.get(domain)
+    results["OAuthClientConfigs.get, cold (us)"] = (time.perf_counter() - start) / len(domains) * 1e6
+    results["OAuthClientConfigs.get, warm (us)"] = time_lookups(configs.get, domains, args.rounds)
+
+    for name, micros in results.items():
+        print(f"{name:<36} {micros:>10.1f}")
+    print(f"cache: {configs.stats()}")
+    collection.drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Microbenchmark for rate limiter admit latency as the per-token window grows.
+#
+#   python benchmarks/rate_limiter_bench.py
+#
+# Compares the previous list-rebuilding limiter against InMemoryRateLimiter,
+# and MongoRateLimiter when mongomock is installed.
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import InMemoryRateLimiter, MongoRateLimiter
+
+WINDOW_SIZES = [200, 2000, 20000]
+ADMITS = 500
+
+
+def list_rebuild_admit(token_info, limit, plugin_name):
+    # the limiter app.py used before: rebuild the whole bucket on every request
+    now = datetime.utcnow()
+    valid_requests = [req for req in token_info["bucket"] if (now - req["date_sent"]).total_seconds() < 86400]
+    token_info["bucket"] = valid_requests
+    if len(valid_requests) < limit:
+        valid_requests.append({"date_sent": now, "plugin_name": plugin_name})
+        token_info["total_use"] += 1
+        return True
+    return False
+
+
+def time_admits(admit):
+    start = time.perf_counter()
+    for _ in range(ADMITS):
+        admit()
+    return (time.perf_counter() - start) / ADMITS * 1e6
+
+
+def main():
+    print(f"{'window':>8} {'list rebuild (us)':>18} {'deque (us)':>12} {'mongo (us)':>12}")
+    for size in WINDOW_SIZES:
+        # prefill both limiters so every admit runs against a full window
+        now = datetime.utcnow()
+        token_info = {"total_use": size, "bucket": [{"date_sent": now, "plugin_name": "bench"} for _ in range(size)]}
+        list_us = time_admits(lambda: list_rebuild_admit(token_info, size + ADMITS, "bench"))
+
+        limiter = InMemoryRateLimiter(size + ADMITS, 86400)
+        for _ in range(size):
+            limiter.admit("bench", "bench")
+        deque_us = time_admits(lambda: limiter.admit("bench", "bench"))
+
+        mongo_us = "n/a"
+        try:
+            import mongomock
+            collection = mongomock.MongoClient().db["openplugin-rate-limits"]
+            mongo_limiter = MongoRateLimiter(collection, size + ADMITS, 86400)
+            mongo_us = f"{time_admits(lambda: mongo_limiter.admit('bench', 'bench')):.1f}"
+        except ImportError:
+            pass
+
+        print(f"{size:>8} {list_us:>18.1f} {deque_us:>12.1f} {mongo_us:>12}")
+
+
+if __name__ == '__main__':
+    main()
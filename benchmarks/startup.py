@@ -0,0 +1,99 @@
+# Startup cost of the app: import profile plus time to first response.
+#
+#   python benchmarks/startup.py --workers 4 --runs 3
+#
+# Runs `python -X importtime -c "import app"` and reports the wall time and
+# the slowest top-level imports, then boots gunicorn against the stub server
+# with GUNICORN_PRELOAD off and on and reports, per mode, how long it takes
+# from spawning gunicorn until the first response (/metrics) and until the
+# plugin directory is loaded (/ready).
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from load_test import AUTHORIZATION_SECRET, app_env, free_port, spawn_app, wait_for
+from stubs import start_stub_server
+
+
+def import_profile(stub_url: str, top: int) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=REPO_DIR,
+        env=app_env(stub_url, free_port()),
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+
+    # lines look like "import time:  self [us] | cumulative | <2 spaces per level>package"
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative)
+        elif depth == 1:
+            # what the app (and anything else imported at top level) pulls in directly
+            modules.append((name.strip(), int(cumulative)))
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "imports_ms": round(total / 1000, 1),
+        "slowest": [{"module": name, "cumulative_ms": round(cumulative / 1000, 1)} for name, cumulative in modules[:top]],
+    }
+
+
+def boot(stub_url: str, workers: int, preload: bool) -> dict:
+    start = time.perf_counter()
+    process, base_url = spawn_app(stub_url, 'gthread', workers, 8, {"GUNICORN_PRELOAD": str(preload).lower()})
+    try:
+        if not wait_for(f"{base_url}/metrics", headers={"authorization": AUTHORIZATION_SECRET}):
+            raise RuntimeError("The app did not respond within 60 seconds")
+        first_response = time.perf_counter() - start
+        if not wait_for(f"{base_url}/ready"):
+            raise RuntimeError("The plugin directory did not load within 60 seconds")
+        ready = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return {"first_response_ms": round(first_response * 1000, 1), "ready_ms": round(ready * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    args = parser.parse_args()
+
+    stub = start_stub_server()
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    report = {"import": import_profile(stub_url, args.top), "boot": []}
+    for preload in (False, True):
+        runs = [boot(stub_url, args.workers, preload) for _ in range(args.runs)]
+        report["boot"].append({
+            "preload_app": preload,
+            "workers": args.workers,
+            "runs": runs,
+            "best_first_response_ms": min(run["first_response_ms"] for run in runs),
+            "best_ready_ms": min(run["ready_ms"] for run in runs),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Time-to-first-byte for /chat_completion with and without `stream: true`.
+#
+#   python benchmarks/stream_ttfb.py --latency 0.5
+#
+# Boots the app against the stub OpenAI/plugin server (which streams chat
+# completions word by word) and prints the SSE events it receives.
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import EARLY_ACCESS_TOKEN, start_app
+from stubs import STUB_NAMESPACE, start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.latency)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    process, base_url = start_app(stub_url, 'gthread', 1, 8)
+    body = {
+        "early_access_token": EARLY_ACCESS_TOKEN,
+        "plugin_name": STUB_NAMESPACE,
+        "model": "gpt-3.5-turbo-1106",
+        "messages": [{"role": "user", "content": "What is on my todo list?"}],
+    }
+
+    try:
+        results = {"buffered": [], "stream": []}
+        for run in range(args.runs):
+            start = time.perf_counter()
+            response = requests.post(f"{base_url}/chat_completion", json=body, timeout=60)
+            response.raise_for_status()
+            total = time.perf_counter() - start
+            results["buffered"].append({"ttfb_ms": round(total * 1000, 1), "total_ms": round(total * 1000, 1)})
+
+            start = time.perf_counter()
+            events = []
+            with requests.post(f"{base_url}/chat_completion", json={**body, "stream": True}, stream=True, timeout=60) as response:
+                ttfb = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    if line.startswith('event: '):
+                        events.append((line[len('event: '):], round((time.perf_counter() - start) * 1000, 1)))
+            total = time.perf_counter() - start
+            results["stream"].append({"ttfb_ms": round(ttfb * 1000, 1), "total_ms": round(total * 1000, 1)})
+            if run == 0:
+                print("stream events (name, ms since request):", events, file=sys.stderr)
+
+        summary = {
+            mode: {
+                "ttfb_ms": round(sum(run["ttfb_ms"] for run in runs) / len(runs), 1),
+                "total_ms": round(sum(run["total_ms"] for run in runs) / len(runs), 1),
+            }
+            for mode, runs in results.items()
+        }
+        print(json.dumps(summary, indent=2))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
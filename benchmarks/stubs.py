@@ -0,0 +1,157 @@
+# Local stand-ins for the OpenAI API, a sample plugin and the plugin directory,
+# so benchmarks can drive the app without leaving the machine.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+PLUGIN_DIRECTORY_URL = 'https://raw.githubusercontent.com/CakeCrusher/openplugin/main/migrations/plugin_store/openplugins.json'
+STUB_NAMESPACE = 'stub_todo'
+STUB_OAUTH_DOMAIN = 'stub-todo.example'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def send_json(self, body, status=200, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, completion):
+        # OpenAI-style server-sent events, one chunk per word of the answer
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        words = completion["choices"][0]["message"]["content"].split(" ")
+        for index, word in enumerate(words):
+            content = word if index == 0 else f" {word}"
+            chunk = {**completion, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.latency / len(words))
+        chunk = {**completion, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        self.wfile.flush()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/openplugins.json':
+            if self.headers.get('If-None-Match') == '"stub-directory"':
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            return self.send_json({STUB_NAMESPACE: self.base_url}, headers={'ETag': '"stub-directory"'})
+        if path == '/.well-known/ai-plugin.json':
+            return self.send_json({
+                "schema_version": "v1",
+                "name_for_model": STUB_NAMESPACE,
+                "name_for_human": "Stub Todo",
+                "description_for_human": "Manage a stub todo list.",
+                "description_for_model": "Plugin for listing the user's todos.",
+                "auth": {"type": "none"},
+                "api": {"type": "openapi", "url": f"{self.base_url}/openapi.json"},
+                "logo_url": f"{self.base_url}/logo.png",
+                "contact_email": "stub@example.com",
+                "legal_info_url": f"{self.base_url}/legal",
+            })
+        if path == '/openapi.json':
+            return self.send_json({
+                "openapi": "3.0.1",
+                "info": {"title": "Stub Todo", "version": "v1"},
+                "servers": [{"url": self.base_url}],
+                "paths": {
+                    "/todos": {
+                        "get": {
+                            "operationId": "getTodos",
+                            "summary": "Get the list of todos",
+                            "responses": {"200": {"description": "OK"}},
+                        }
+                    }
+                },
+            })
+        if path == '/todos':
+            time.sleep(self.latency)
+            return self.send_json({"todos": ["buy milk", "walk the dog", "write benchmarks"]})
+        self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        raw_body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.loads(raw_body) if self.headers.get('Content-Type', '').startswith('application/json') and raw_body else {}
+        if path.endswith('/chat/completions'):
+            time.sleep(self.latency)
+            if body.get("stream"):
+                return self.send_stream(chat_completion_body(body))
+            return self.send_json(chat_completion_body(body))
+        if path == '/oauth/token':
+            time.sleep(self.latency)
+            return self.send_json({"access_token": "stub-access-token", "token_type": "bearer", "expires_in": 3600})
+        self.send_json({"error": "not found"}, status=404)
+
+
+def chat_completion_body(body):
+    if body.get("functions"):
+        name = body["functions"][0]["name"]
+        arguments = {"stimulous_prompt": "What is on my todo list?"} if name == "stimulous_prompt_generation" else {}
+        message = {"role": "assistant", "content": None, "function_call": {"name": name, "arguments": json.dumps(arguments)}}
+        finish_reason = "function_call"
+    else:
+        message = {"role": "assistant", "content": "You have three todos: buy milk, walk the dog and write benchmarks."}
+        finish_reason = "stop"
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo-1106"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    handler = type('StubHandler', (StubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed_oauth_client(db, domain: str = STUB_OAUTH_DOMAIN):
+    # the openplugin-auth document /oauth_initialization and /oauth_token look up
+    db["openplugin-auth"].replace_one(
+        {"domain": domain},
+        {"domain": domain, "oauth": {"client_id": "stub-client", "client_secret": "stub-secret"}},
+        upsert=True,
+    )
+
+
+def redirect_plugin_directory(stub_url: str):
+    # openplugincore hardcodes the GitHub directory URL, so point it at the stub
+    send = requests.sessions.Session.request
+
+    def request(self, method, url, *args, **kwargs):
+        if url == PLUGIN_DIRECTORY_URL:
+            url = f"{stub_url}/openplugins.json"
+        return send(self, method, url, *args, **kwargs)
+
+    requests.sessions.Session.request = request
@@ -0,0 +1,104 @@
+# End-to-end benchmark of every main route under gunicorn.
+#
+#   python benchmarks/suite.py --requests 200 --concurrency 32 --output results.json
+#   python benchmarks/suite.py --mongo-uri mongodb://localhost:27017 --baseline results.json
+#
+# Starts the stub OpenAI/plugin/OAuth server, boots the app under gunicorn
+# against mongomock (or a real MongoDB with --mongo-uri) and drives each route
+# in turn. Prints one JSON document with throughput, p50/p95/p99 latency and
+# worker RSS per route. With --baseline, each route also gets the change in
+# throughput and p95 relative to a previous run's output.
+#
+# mongomock keeps data per worker; the OAuth round trip stays on one worker
+# through keep-alive, but use --mongo-uri for numbers that include MongoDB.
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from load_test import drive, start_app, worker_rss_mb
+from stubs import seed_oauth_client, start_stub_server
+
+ROUTES = 'chat_completion,plugin,eval_tentative,eval_supported,oauth'
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    def change(key):
+        if not baseline.get(key):
+            return None
+        return round((result[key] - baseline[key]) / baseline[key] * 100, 1)
+
+    return {"requests_per_second_pct": change("requests_per_second"), "p95_ms_pct": change("p95_ms")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds the stub OpenAI, plugin and OAuth APIs take to answer')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--routes', default=ROUTES)
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route before measuring')
+    parser.add_argument('--mongo-uri', help='use this MongoDB instead of mongomock')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--baseline', help='JSON output of a previous run to compare against')
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.latency)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    extra_env = {}
+    if args.mongo_uri:
+        from pymongo import MongoClient
+
+        seed_oauth_client(MongoClient(args.mongo_uri)["openplugin-io"])
+        extra_env = {"BENCH_MONGO": "uri", "MONGODB_URI": args.mongo_uri}
+
+    process, base_url = start_app(stub_url, args.worker_class, args.workers, args.threads, extra_env)
+    results = []
+    try:
+        for route in args.routes.split(','):
+            # the early access token allows 200 requests a day per worker
+            total = min(args.requests, 200 - args.warmup) if route == 'chat_completion' else args.requests
+            if args.warmup:
+                drive(base_url, route, stub_url, args.warmup, min(args.warmup, args.concurrency))
+            results.append({**drive(base_url, route, stub_url, total, args.concurrency), "rss": worker_rss_mb(process)})
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "config": {
+            "worker_class": args.worker_class,
+            "workers": args.workers,
+            "threads": args.threads,
+            "stub_latency": args.latency,
+            "mongo": "uri" if args.mongo_uri else "mongomock",
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = {result["route"]: result for result in json.load(baseline_file)["results"]}
+        for result in results:
+            if result["route"] in baseline:
+                result["vs_baseline"] = compare(result, baseline[result["route"]])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
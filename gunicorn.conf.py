@@ -0,0 +1,19 @@
+import os
+
+# Requests spend most of their time waiting on OpenAI and plugin APIs, so each
+# worker serves many of them on threads instead of one request per process
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 64))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+# The app is imported once in the master and workers fork with it loaded, so a
+# worker boots without re-importing openplugincore and friends. Mongo, pooled
+# connections, logging and background threads are recreated in every worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+
+def post_worker_init(worker):
+    from app import start_background_services
+
+    start_background_services()
@@ -0,0 +1,162 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HostStats:
+    def __init__(self, samples: int = 512):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=samples)
+
+    def record(self, seconds: float, error: bool):
+        self.requests += 1
+        self.errors += int(error)
+        self.total_seconds += seconds
+        self.latencies.append(seconds)
+
+    def merge(self, other: "HostStats"):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.total_seconds += other.total_seconds
+        self.latencies.extend(other.latencies)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.latencies)
+        percentile = lambda fraction: round(ordered[int(fraction * (len(ordered) - 1))] * 1000, 1) if ordered else None
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.requests * 1000, 1) if self.requests else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class OutboundHTTP:
+    """Shared keep-alive session for every outbound HTTP call the app makes.
+
+    Connections are pooled per host by urllib3, idempotent requests and
+    connection failures are retried with exponential backoff, and every call
+    gets a default timeout. Per-host latency and how often pooled connections
+    were reused are tracked for the admin view.
+
+    Hosts come from user input, so at most `max_hosts` are tracked on their
+    own; the least recently used host is folded into an "other" bucket.
+    """
+
+    OTHER = "other"
+
+    def __init__(self, pool_connections: int, pool_maxsize: int, timeout: float, retries: int, backoff_factor: float,
+                 max_hosts: int = 256):
+        self.timeout = timeout
+        self.session = _MeteredSession(self)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # connection errors are retried for any method, status retries only for idempotent ones
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.max_hosts = max_hosts
+        self._hosts: "OrderedDict[str, HostStats]" = OrderedDict()
+        self._other = HostStats()
+        self._lock = threading.Lock()
+
+    def record(self, url: str, seconds: float, error: bool):
+        host = urlsplit(url).netloc
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = HostStats()
+                while len(self._hosts) > self.max_hosts:
+                    _, evicted = self._hosts.popitem(last=False)
+                    self._other.merge(evicted)
+            else:
+                self._hosts.move_to_end(host)
+            stats.record(seconds, error)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.session.request("POST", url, **kwargs)
+
+    def install(self, *modules):
+        # swap the `requests` module that third-party code calls for this pool
+        shim = _RequestsShim(self)
+        for module in modules:
+            module.requests = shim
+
+    def stats(self) -> dict:
+        pools = {}
+        for key, pool in list(self.adapter.poolmanager.pools._container.items()):
+            pools[f"{key.key_host}:{key.key_port}"] = pool
+        with self._lock:
+            hosts = {host: stats.snapshot() for host, stats in self._hosts.items()}
+            if self._other.requests:
+                hosts[self.OTHER] = self._other.snapshot()
+        for host, snapshot in hosts.items():
+            pool = pools.get(host) or pools.get(f"{host}:443") or pools.get(f"{host}:80")
+            if pool is not None:
+                snapshot["connections_opened"] = pool.num_connections
+                snapshot["connection_reuse_ratio"] = round(1 - pool.num_connections / pool.num_requests, 4) if pool.num_requests else None
+        return hosts
+
+
+class _MeteredSession(requests.Session):
+    def __init__(self, outbound: OutboundHTTP):
+        super().__init__()
+        self._outbound = outbound
+        # one session serves every user, so never carry cookies from one call to the next
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def close(self):
+        # openai's api_requestor closes its session every 180 seconds, which would drop
+        # every pooled connection for all hosts; the shared session lives as long as the process
+        pass
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self._outbound.timeout
+        start = time.perf_counter()
+        error = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            self._outbound.record(url, time.perf_counter() - start, error)
+
+
+class _RequestsShim:
+    # quacks like the `requests` module, but routes calls through OutboundHTTP
+    def __init__(self, outbound: OutboundHTTP):
+        self._outbound = outbound
+
+    def request(self, method, url, **kwargs):
+        return self._outbound.request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        return self._outbound.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self._outbound.request("POST", url, data=data, json=json, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
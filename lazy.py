@@ -0,0 +1,57 @@
+import os
+import threading
+from typing import Any, Callable
+
+_UNSET = object()
+
+
+class Lazy:
+    """Proxy that builds its target on first use and rebuilds it after fork.
+
+    Attribute access resolves the target; item access returns another Lazy,
+    so `Lazy(make_client)["db"]["collection"]` can be handed out at import
+    time without connecting anything. Children follow their parent, so
+    when the root is reset (automatically in a forked child) every
+    collection handed out before is rebuilt against the new client on its
+    next use.
+    """
+
+    def __init__(self, factory: Callable[[], Any], parent: "Lazy" = None, reset_after_fork: bool = False):
+        self._factory = factory
+        self._parent = parent
+        self._value = _UNSET
+        self._generation = None
+        self._lock = threading.Lock()
+        self._reset_count = 0
+        if reset_after_fork:
+            os.register_at_fork(after_in_child=self.reset)
+
+    def _current_generation(self):
+        return self._parent._current_generation() if self._parent is not None else self._reset_count
+
+    def resolve(self):
+        generation = self._current_generation()
+        value = self._value
+        if value is _UNSET or self._generation != generation:
+            with self._lock:
+                if self._value is _UNSET or self._generation != generation:
+                    self._value = self._factory()
+                    self._generation = generation
+                value = self._value
+        return value
+
+    @property
+    def resolved(self) -> bool:
+        return self._value is not _UNSET and self._generation == self._current_generation()
+
+    def reset(self):
+        # a forked child must not reuse sockets or monitor threads from its parent
+        self._lock = threading.Lock()
+        self._value = _UNSET
+        self._reset_count += 1
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, key):
+        return Lazy(lambda: self.resolve()[key], parent=self)
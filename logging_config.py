@@ -0,0 +1,41 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+
+def _start_listener(stream_handler: logging.Handler):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logging.getLogger().handlers = [QueueHandler(log_queue)]
+
+
+def _restart_after_fork():
+    # the listener thread does not survive fork, so a preloaded gunicorn
+    # worker would otherwise queue records that are never written
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def configure_logging(level: str = "INFO"):
+    """Send all app logging through a queue drained by a background thread.
+
+    Request threads only enqueue records, so a slow or blocked stdout never
+    adds latency to the hot path. Safe to call more than once, and forked
+    children get a listener of their own.
+    """
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"))
+    _start_listener(stream_handler)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+    logging.getLogger().setLevel(level.upper())
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import time
+from typing import Callable, List, Tuple
+from urllib.parse import urljoin
+
+import yaml
+
+from cache import SingleFlight, TTLCache
+
+# Subset of JSON Schema (type, required, properties, minLength, minProperties)
+# compiled once into nested checks, so validating a document is a walk over
+# plain closures instead of re-interpreting the schema on every call
+MANIFEST_SCHEMA = {
+    "type": "object",
+    "required": ["name_for_model", "description_for_human", "description_for_model", "auth", "logo_url", "api"],
+    "properties": {
+        "name_for_model": {"type": "string", "minLength": 1},
+        "description_for_human": {"type": "string", "minLength": 1},
+        "description_for_model": {"type": "string", "minLength": 1},
+        "logo_url": {"type": "string", "minLength": 1},
+        "auth": {"type": "object", "required": ["type"], "properties": {"type": {"type": "string", "minLength": 1}}},
+        "api": {"type": "object", "required": ["url"], "properties": {"url": {"type": "string", "minLength": 1}}},
+    },
+}
+
+OPENAPI_SCHEMA = {
+    "type": "object",
+    "required": ["openapi", "paths"],
+    "properties": {
+        "openapi": {"type": "string", "minLength": 1},
+        "info": {"type": "object"},
+        "servers": {"type": "array"},
+        "paths": {"type": "object", "minProperties": 1},
+    },
+}
+
+_TYPES = {"object": dict, "array": list, "string": str}
+
+
+def compile_schema(schema: dict, path: str = "") -> Callable[[object], List[str]]:
+    # returns a function that lists every violation of `schema` in a document
+    checks = []
+    expected = _TYPES.get(schema.get("type"))
+    if expected is not None:
+        type_name = schema["type"]
+        checks.append(lambda value: [] if isinstance(value, expected) else [f"{path or 'document'} must be a{'n' if type_name[0] in 'aeiou' else ''} {type_name}"])
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(lambda value: [f"{path} must not be empty"] if isinstance(value, str) and len(value.strip()) < min_length else [])
+    if "minProperties" in schema:
+        min_properties = schema["minProperties"]
+        checks.append(lambda value: [f"{path} must not be empty"] if isinstance(value, dict) and len(value) < min_properties else [])
+    for key in schema.get("required", []):
+        checks.append(lambda value, key=key: [f"{path + '.' if path else ''}{key} is required"] if isinstance(value, dict) and key not in value else [])
+    for key, subschema in schema.get("properties", {}).items():
+        check_property = compile_schema(subschema, f"{path + '.' if path else ''}{key}")
+        checks.append(lambda value, key=key, check=check_property: check(value[key]) if isinstance(value, dict) and key in value else [])
+
+    def validate(value) -> List[str]:
+        errors = []
+        for check in checks:
+            errors.extend(check(value))
+            # further checks assume the right type
+            if errors and expected is not None and not isinstance(value, expected):
+                break
+        return errors
+
+    return validate
+
+
+validate_manifest = compile_schema(MANIFEST_SCHEMA, "manifest")
+validate_openapi = compile_schema(OPENAPI_SCHEMA, "openapi")
+
+
+def parse_document(body: bytes):
+    try:
+        return json.loads(body)
+    except ValueError:
+        # plenty of plugins publish openapi.yaml
+        return yaml.safe_load(body)
+
+
+def not_modified(etag: str, status_code: int, if_none_match: str) -> bool:
+    # only a valid plugin may be answered with a 304, failed validations are always sent in full
+    return status_code == 200 and etag in [tag.strip() for tag in (if_none_match or "").split(",")]
+
+
+class ManifestValidator:
+    """Validates a plugin's ai-plugin.json and OpenAPI spec for /eval/tentative.
+
+    Both documents are fetched with conditional requests and reused without
+    asking the origin for `revalidate_after` seconds. Validation results are
+    memoized by a hash of the document contents, which doubles as the
+    response ETag, so unchanged plugins are answered from memory (or with a
+    304) without re-parsing or re-checking anything.
+
+    Documents larger than `max_document_bytes` are refused before they are
+    read in full, and each cache holds at most `max_bytes` of them.
+    """
+
+    def __init__(self, session, max_entries: int, revalidate_after: float, max_bytes: int,
+                 max_document_bytes: int, document_ttl: float = 86400):
+        self.session = session
+        self.revalidate_after = revalidate_after
+        self.max_document_bytes = max_document_bytes
+        self.documents = TTLCache(max_entries * 2, document_ttl, max_bytes=max_bytes, sizeof=lambda document: len(document["body"]))
+        self.results = TTLCache(max_entries, document_ttl, max_bytes=max_bytes, sizeof=lambda result: len(json.dumps(result[0])))
+        self._flight = SingleFlight()
+
+    def _read(self, url: str, response) -> bytes:
+        too_large = ValueError(f"{url} is larger than {self.max_document_bytes} bytes")
+        if int(response.headers.get("Content-Length") or 0) > self.max_document_bytes:
+            raise too_large
+        body = b""
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body += chunk
+            if len(body) > self.max_document_bytes:
+                raise too_large
+        return body
+
+    def fetch(self, url: str) -> bytes:
+        cached = self.documents.get(url)
+        if cached and time.monotonic() - cached["fetched_at"] < self.revalidate_after:
+            return cached["body"]
+
+        def load():
+            headers = {}
+            if cached and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+            response = self.session.get(url, headers=headers, timeout=30, stream=True)
+            try:
+                if response.status_code == 304 and cached:
+                    body = cached["body"]
+                else:
+                    response.raise_for_status()
+                    body = self._read(url, response)
+            finally:
+                response.close()
+            self.documents.set(url, {
+                "body": body,
+                "etag": response.headers.get("ETag") or (cached or {}).get("etag"),
+                "last_modified": response.headers.get("Last-Modified") or (cached or {}).get("last_modified"),
+                "fetched_at": time.monotonic(),
+            })
+            return body
+
+        body, _ = self._flight.do(url, load)
+        return body
+
+    def evaluate(self, root_url: str) -> Tuple[str, dict, int, bool]:
+        # returns (etag, body, status_code, cached)
+        manifest_body = self.fetch(f"{root_url}/.well-known/ai-plugin.json")
+        manifest = parse_document(manifest_body)
+        openapi_url = manifest.get("api", {}).get("url") if isinstance(manifest, dict) and isinstance(manifest.get("api"), dict) else None
+        # relative spec urls are resolved against the plugin's root
+        openapi_body = self.fetch(urljoin(f"{root_url}/", openapi_url)) if isinstance(openapi_url, str) and openapi_url else b""
+
+        digest = hashlib.sha256()
+        for part in (root_url.encode(), manifest_body, openapi_body):
+            digest.update(hashlib.sha256(part).digest())
+        etag = f'"{digest.hexdigest()[:32]}"'
+
+        result = self.results.get(etag)
+        if result is not None:
+            return (etag, *result, True)
+        result = self._validate(root_url, manifest, openapi_body)
+        self.results.set(etag, result)
+        return (etag, *result, False)
+
+    def _validate(self, root_url: str, manifest, openapi_body: bytes) -> Tuple[dict, int]:
+        errors = validate_manifest(manifest)
+        if not errors:
+            try:
+                errors = validate_openapi(parse_document(openapi_body))
+            except yaml.YAMLError as e:
+                errors = [f"openapi could not be parsed: {str(e).splitlines()[0]}"]
+        if errors:
+            return {"error": f"Invalid plugin: {'; '.join(errors)}"}, 400
+
+        return {
+            "namespace": manifest["name_for_model"],
+            "image": manifest["logo_url"],
+            "description_for_human": manifest["description_for_human"],
+            "description_for_model": manifest["description_for_model"],
+            "domain": root_url,
+            "openapi_url": manifest["api"]["url"],
+            "auth": manifest["auth"],
+            "blacklisted": False,
+            "whitelisted": True,
+            "stimulous_prompt": None,  # This will be populated later
+            "stimulated": False,
+            "status": "tentative"
+        }, 200
+
+    def stats(self) -> dict:
+        return {"documents": self.documents.stats(), "results": self.results.stats()}
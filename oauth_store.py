@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import PyMongoError
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class OAuthClientConfigs:
+    """Read-through cache of `openplugin-auth` client configs keyed by domain.
+
+    Configs hold client secrets, so entries live for at most `ttl` seconds
+    and are never written anywhere but process memory. When the deployment
+    runs on a replica set, a change stream evicts edited documents right
+    away; otherwise the TTL bounds how stale a config can get.
+    """
+
+    def __init__(self, collection, ttl: float, max_entries: int, negative_ttl: float = 30):
+        self.collection = collection
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_entries, ttl)
+        self._watcher = None
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index("domain", unique=True)
+        except PyMongoError as e:
+            # an existing duplicate domain makes the unique build fail; lookups still work without it
+            logger.warning("could not ensure unique index on openplugin-auth.domain: %s", e)
+
+    def get(self, domain: str) -> Optional[dict]:
+        # unknown domains are remembered briefly so a newly added client shows up quickly;
+        # the shorter TTL is only set when the miss is loaded, not again on every hit
+        return self.cache.get_or_load(
+            domain,
+            lambda: self.collection.find_one({"domain": domain}),
+            ttl=lambda config: None if config is not None else self.negative_ttl,
+        )
+
+    def watch(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name="oauth-config-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        try:
+            with self.collection.watch(full_document="updateLookup") as stream:
+                for change in stream:
+                    domain = (change.get("fullDocument") or {}).get("domain")
+                    if change["operationType"] == "insert" and domain:
+                        self.cache.invalidate(domain)
+                    else:
+                        # updates may have changed the domain and deletes only carry the _id
+                        self.cache.clear()
+        except PyMongoError as e:
+            logger.warning("oauth config change stream stopped, relying on TTL expiry: %s", e)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "watching": self._watcher is not None and self._watcher.is_alive()}
+
+
+def hash_nonce(nonce: str) -> str:
+    # only the hash of the browser's nonce cookie is stored next to the flow
+    return hashlib.sha256(nonce.encode()).hexdigest()
+
+
+class InMemoryStateStore:
+    """In-flight OAuth flows keyed by `state`, for single-process deployments."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def put(self, state: str, data: dict, nonce: str):
+        now = time.monotonic()
+        with self._lock:
+            # abandoned flows are dropped whenever a new one starts
+            for expired in [key for key, (expires_at, _, _) in self._states.items() if expires_at <= now]:
+                del self._states[expired]
+            self._states[state] = (now + self.ttl, hash_nonce(nonce), data)
+
+    def consume(self, state: str, nonce: str) -> Optional[dict]:
+        # a state is only redeemed from the browser that started the flow
+        with self._lock:
+            expires_at, nonce_hash, data = self._states.get(state, (0, "", None))
+            if not nonce or not hmac.compare_digest(nonce_hash, hash_nonce(nonce)):
+                return None
+            del self._states[state]
+        return data if expires_at > time.monotonic() else None
+
+
+class MongoStateStore:
+    """In-flight OAuth flows shared by every worker through a TTL-indexed collection.
+
+    `consume` is a single find_one_and_delete, so a state can only ever be
+    redeemed once even if the callback hits two workers at the same time,
+    and only together with the nonce of the browser that started the flow.
+    """
+
+    def __init__(self, collection, ttl: float):
+        self.collection = collection
+        self.ttl = ttl
+        self._indexes_ready = False
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def put(self, state: str, data: dict, nonce: str):
+        self._ensure_indexes()
+        self.collection.insert_one({
+            "_id": state,
+            "nonce_hash": hash_nonce(nonce),
+            "data": data,
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl),
+        })
+
+    def consume(self, state: str, nonce: str) -> Optional[dict]:
+        if not nonce:
+            return None
+        self._ensure_indexes()
+        # the TTL monitor only runs once a minute, so filter on expiry too
+        doc = self.collection.find_one_and_delete({
+            "_id": state,
+            "nonce_hash": hash_nonce(nonce),
+            "expires_at": {"$gt": datetime.utcnow()},
+        })
+        return doc["data"] if doc else None
+
+
+def create_state_store(backend: str, ttl: float, db=None):
+    if backend == "memory":
+        return InMemoryStateStore(ttl)
+    if backend == "mongo":
+        if db is None:
+            raise ValueError("The mongo OAuth state backend requires a database")
+        return MongoStateStore(db["openplugin-oauth-states"], ttl)
+    raise ValueError(f"Unknown OAuth state backend \"{backend}\"")
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+PLUGIN_DIRECTORY_URL = 'https://raw.githubusercontent.com/CakeCrusher/openplugin/main/migrations/plugin_store/openplugins.json'
+
+
+class PluginDirectoryRefresher:
+    """Keeps an OpenPluginMemo's directory and hottest plugins warm off the request path.
+
+    A daemon thread loads the plugin directory, swaps it into the memo in one
+    assignment, initializes the top-N plugins (manifest + OpenAPI spec), then
+    re-checks the directory on an interval. Refreshes are conditional (ETag /
+    Last-Modified) and incremental: plugins whose root url did not change keep
+    their already initialized objects. `memo.plugins` is only ever changed in
+    place, so plugins that requests add while a refresh runs are kept.
+
+    Plugins to warm are ranked: `warm_namespaces` first, then this process's
+    own usage, then `popular_plugins(n)` (persisted usage across workers), so
+    a freshly started worker warms what was popular before it existed.
+    """
+
+    def __init__(self, memo, interval: float, warm_top_n: int, warm_namespaces: List[str] = None,
+                 directory_url: str = PLUGIN_DIRECTORY_URL, warm_concurrency: int = 4, session=requests,
+                 popular_plugins: Callable[[int], List[str]] = None):
+        self.memo = memo
+        self.session = session
+        self.interval = interval
+        self.warm_top_n = warm_top_n
+        self.warm_namespaces = warm_namespaces or []
+        self.directory_url = directory_url
+        self.warm_concurrency = warm_concurrency
+        self.popular_plugins = popular_plugins
+        self.usage = Counter()
+        self._usage_lock = threading.Lock()
+        self._validators: Dict[str, str] = {}
+        self._loaded = threading.Event()
+        self._warm = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._created_at = time.perf_counter()
+        self._status = {
+            "refreshes": 0,
+            "unchanged_refreshes": 0,
+            "last_refresh": None,
+            "last_error": None,
+            "directory_load_ms": None,
+            "warmup_ms": None,
+            "ready_after_ms": None,
+            "warmed": [],
+            "warm_note": None,
+        }
+
+    def start(self):
+        # a thread inherited through fork is no longer running
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="plugin-directory-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def record_use(self, namespace: str):
+        with self._usage_lock:
+            self.usage[namespace] += 1
+
+    def wait_loaded(self, timeout: float) -> bool:
+        return self._loaded.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self._warm.is_set()
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "directory_loaded": self._loaded.is_set(),
+            "directory_size": len(self.memo.plugins_directory or {}),
+            "plugins_initialized": len(self.memo.plugins),
+            **self._status,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self._status["last_error"] = None
+            except Exception as e:
+                self._status["last_error"] = f"{type(e).__name__} error: {str(e)}"
+                logger.warning("plugin directory refresh failed: %s", self._status["last_error"])
+            # retry sooner while the directory has never been loaded
+            self._stop.wait(self.interval if self._loaded.is_set() else min(self.interval, 5))
+
+    def refresh(self):
+        start = time.perf_counter()
+        headers = {}
+        if self._validators.get("etag"):
+            headers["If-None-Match"] = self._validators["etag"]
+        if self._validators.get("last_modified"):
+            headers["If-Modified-Since"] = self._validators["last_modified"]
+
+        response = self.session.get(self.directory_url, headers=headers, timeout=30)
+        self._status["refreshes"] += 1
+        self._status["last_refresh"] = datetime.utcnow().isoformat()
+        if response.status_code == 304 and self._loaded.is_set():
+            self._status["unchanged_refreshes"] += 1
+            self._warm_up(self.memo.plugins_directory)
+            return
+        if not response.ok:
+            raise Exception(f"Unable to fetch plugins from github url '{self.directory_url}'")
+
+        directory = dict(response.json())
+        self._validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+        # drop initialized plugins whose root url changed or that left the directory
+        previous = self.memo.plugins_directory or {}
+        for name in [name for name in list(self.memo.plugins) if name not in directory or directory[name] != previous.get(name)]:
+            self.memo.plugins.pop(name, None)
+        self.memo.plugins_directory = directory
+        if not self._loaded.is_set():
+            self._status["directory_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            self._loaded.set()
+
+        self._warm_up(directory)
+
+    def _warm_up(self, directory: dict):
+        start = time.perf_counter()
+        wanted = [namespace for namespace in self.warm_namespaces if namespace in directory]
+        with self._usage_lock:
+            usage = Counter(self.usage)
+        wanted += [namespace for namespace, _ in usage.most_common() if namespace in directory and namespace not in wanted]
+        if len(wanted) < self.warm_top_n and self.popular_plugins is not None:
+            try:
+                popular = self.popular_plugins(self.warm_top_n)
+            except Exception as e:
+                # persisted usage only improves the ranking, it must never block readiness
+                logger.warning("failed to load popular plugins: %s error: %s", type(e).__name__, str(e))
+                popular = []
+            wanted += [namespace for namespace in popular if namespace in directory and namespace not in wanted]
+        wanted = wanted[:self.warm_top_n]
+        missing = [namespace for namespace in wanted if namespace not in self.memo.plugins]
+
+        if missing:
+            def init(namespace):
+                try:
+                    return namespace, self.memo.init_openplugin(plugin_name=namespace)
+                except Exception as e:
+                    logger.warning("failed to warm plugin \"%s\": %s error: %s", namespace, type(e).__name__, str(e))
+                    return namespace, None
+
+            with ThreadPoolExecutor(max_workers=self.warm_concurrency, thread_name_prefix="plugin-warmup") as pool:
+                warmed = {namespace: plugin for namespace, plugin in pool.map(init, missing) if plugin}
+            for namespace, plugin in warmed.items():
+                # a request may have initialized the same plugin in the meantime
+                self.memo.plugins.setdefault(namespace, plugin)
+
+        self._status["warmed"] = [namespace for namespace in wanted if namespace in self.memo.plugins]
+        if not wanted:
+            self._status["warm_note"] = "nothing to warm: no PLUGIN_WARM_NAMESPACES, no usage recorded yet"
+        elif not self._status["warmed"]:
+            self._status["warm_note"] = "every plugin to warm failed to initialize"
+        else:
+            self._status["warm_note"] = None
+        if not self._warm.is_set():
+            self._status["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            self._status["ready_after_ms"] = round((time.perf_counter() - self._created_at) * 1000, 1)
+            self._warm.set()
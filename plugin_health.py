@@ -0,0 +1,216 @@
+import copy
+import inspect
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Plugin \"{name}\" is failing, calls are paused for {round(retry_after)}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one plugin backend.
+
+    A call fails when it raises, answers with a 5xx or takes longer than
+    `slow_call_seconds`. After `failure_threshold` failures in a row the
+    breaker opens and calls are refused for `open_seconds`. Then a single
+    probe is let through (half-open): success closes the breaker, failure
+    opens it again. A probe that never reports back is replaced after
+    another `open_seconds`. Calls that were already running when the
+    breaker opened still count towards the stats, but their late results
+    don't change its state.
+    """
+
+    def __init__(self, failure_threshold: int, open_seconds: float, slow_call_seconds: float, samples: int = 256):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._latencies = deque(maxlen=samples)
+        self._counts = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "hedged": 0}
+        self._lock = threading.Lock()
+
+    def allow(self, name: str, probe: bool = True) -> bool:
+        # returns True when the caller was let through as the half-open probe;
+        # probe=False only refuses while open, for callers whose plugin calls can't be recorded
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and now - self._opened_at >= self.open_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not probe:
+                return False
+            if self.state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.open_seconds):
+                self._probe_at = now
+                return True
+            self._counts["rejected"] += 1
+            retry_after = max(self.open_seconds - (now - self._opened_at), 1)
+        raise CircuitOpen(name, retry_after)
+
+    def record(self, seconds: float, failed: bool, probe: bool = False):
+        failed = failed or seconds > self.slow_call_seconds
+        with self._lock:
+            self._latencies.append(seconds)
+            self._counts["calls"] += 1
+            if failed:
+                self._counts["failures"] += 1
+            if self.state == "open" or (self.state == "half_open" and not probe):
+                # started before the breaker opened, only the probe decides what happens next
+                return
+            if self.state == "half_open":
+                self._probe_at = None
+                if failed:
+                    self._open()
+                else:
+                    self._failures = 0
+                    self.state = "closed"
+                return
+            if not failed:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self._counts["opened"] += 1
+        self.state = "open"
+        self._opened_at = time.monotonic()
+
+    def count(self, stat: str):
+        with self._lock:
+            self._counts[stat] += 1
+
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, fraction: float):
+        with self._lock:
+            ordered = sorted(self._latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    def snapshot(self) -> dict:
+        percentiles = {f"p{int(q * 100)}_ms": self.percentile(q) for q in (0.5, 0.95, 0.99)}
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "samples": len(self._latencies),
+                **self._counts,
+                **{key: round(value * 1000, 1) if value is not None else None for key, value in percentiles.items()},
+            }
+
+
+class PluginHealth:
+    """Per-plugin circuit breakers around plugin API calls, with optional hedging.
+
+    `guard` returns a copy of a plugin whose `call_api_fn` times every call
+    to the plugin's own API (not the OpenAI function selection before it)
+    and counts it against that plugin's breaker. With hedging enabled, a GET
+    operation that is still running after the plugin's recent p95 latency
+    gets one duplicate request, and whichever answers first wins.
+
+    At most `max_breakers` plugins are tracked; the least recently used
+    breaker is dropped first, closed ones before open ones.
+    """
+
+    def __init__(self, failure_threshold: int, open_seconds: float, slow_call_seconds: float,
+                 hedge: bool = False, hedge_min_samples: int = 20, hedge_workers: int = 32, max_breakers: int = 1024):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.max_breakers = max_breakers
+        self._hedge_workers = hedge_workers
+        self._hedge_pool = None
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is not None:
+                self._breakers.move_to_end(name)
+                return breaker
+            breaker = self._breakers[name] = CircuitBreaker(self.failure_threshold, self.open_seconds, self.slow_call_seconds)
+            while len(self._breakers) > self.max_breakers:
+                idle = next((key for key, value in self._breakers.items() if value.state == "closed"), None)
+                self._breakers.pop(idle if idle is not None else next(iter(self._breakers)))
+        return breaker
+
+    def guard(self, plugin, name: str, probe: bool = False):
+        # the shared plugin is left alone; each request gets a shallow copy with its own wrapper
+        original = plugin.call_api_fn
+        if original is None:
+            return plugin
+        # oplangchain keeps each operation's HTTP method in the call function's closure;
+        # without it nothing is treated as idempotent and nothing is hedged
+        try:
+            operations = inspect.getclosurevars(original).nonlocals.get("_name_to_call_map", {})
+        except TypeError:
+            operations = {}
+        breaker = self.breaker(name)
+
+        def call_api_fn(operation, *args, **kwargs):
+            idempotent = str(operations.get(operation, {}).get("method", "")).lower() in ("get", "head")
+            start = time.perf_counter()
+            try:
+                if self.hedge and idempotent:
+                    # oplangchain pops path_params and serializes data in place, so every
+                    # attempt gets its own copy of the arguments
+                    call = lambda: original(operation, *copy.deepcopy(args), **copy.deepcopy(kwargs))
+                    response = self._hedged(call, breaker)
+                else:
+                    response = original(operation, *args, **kwargs)
+            except Exception:
+                breaker.record(time.perf_counter() - start, failed=True, probe=probe)
+                raise
+            breaker.record(time.perf_counter() - start, failed=response.status_code >= 500, probe=probe)
+            return response
+
+        guarded = copy.copy(plugin)
+        guarded.call_api_fn = call_api_fn
+        return guarded
+
+    def _hedged(self, call: Callable, breaker: CircuitBreaker):
+        if breaker.samples() < self.hedge_min_samples:
+            return call()
+        if self._hedge_pool is None:
+            with self._lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=self._hedge_workers, thread_name_prefix="plugin-hedge")
+
+        pending = {self._hedge_pool.submit(call)}
+        done, pending = wait(pending, timeout=breaker.percentile(0.95))
+        if done:
+            return done.pop().result()
+        breaker.count("hedged")
+        pending.add(self._hedge_pool.submit(call))
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded:
+                return succeeded[0].result()
+            # a failed attempt only counts once the other one has failed too
+            if not pending:
+                return done.pop().result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "hedging": self.hedge,
+            "plugins": {name: breaker.snapshot() for name, breaker in breakers.items()},
+        }
@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from pymongo.errors import PyMongoError
+
+from cache import SingleFlight
+
+
+class StimulusPromptPool:
+    """Per-plugin pool of generated stimulus prompts.
+
+    Concurrent requests for the same plugin share one generation call. With
+    a pool configured, each plugin collects up to `pool_size` prompts that
+    stay reusable for `max_age` seconds; once the pool is full, requests are
+    answered with a random pooled prompt instead of a new LLM call. Pools
+    live in process memory, or in a MongoDB collection shared by every
+    worker. MongoDB errors fall back to generating.
+    """
+
+    def __init__(self, generate: Callable, pool_size: int, max_age: float, collection=None, enabled: bool = True):
+        self.generate = generate
+        self.pool_size = pool_size if enabled else 0
+        self.max_age = max_age
+        self.collection = collection
+        self._flight = SingleFlight()
+        self._local = {}
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+        self._stats = {"generated": 0, "coalesced": 0, "reused": 0, "store_errors": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self.collection.create_index("plugin")
+        self._indexes_ready = True
+
+    def _pooled(self, key: str) -> list:
+        if self.collection is None:
+            now = time.monotonic()
+            with self._lock:
+                entries = [(expires_at, prompt) for expires_at, prompt in self._local.get(key, []) if expires_at > now]
+                self._local[key] = entries
+            return [prompt for _, prompt in entries]
+
+        try:
+            self._ensure_indexes()
+            # the TTL monitor only runs once a minute, so filter on expiry too
+            docs = self.collection.find(
+                {"plugin": key, "expires_at": {"$gt": datetime.utcnow()}},
+                {"prompt": 1},
+            ).limit(self.pool_size)
+            return [doc["prompt"] for doc in docs]
+        except PyMongoError:
+            self._count("store_errors")
+            return []
+
+    def _add(self, key: str, prompt: str):
+        if self.collection is None:
+            with self._lock:
+                entries = self._local.setdefault(key, [])
+                entries.append((time.monotonic() + self.max_age, prompt))
+                del entries[:-self.pool_size]
+            return
+
+        try:
+            self._ensure_indexes()
+            self.collection.insert_one({
+                "plugin": key,
+                "prompt": prompt,
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.max_age),
+            })
+        except PyMongoError:
+            self._count("store_errors")
+
+    def _generate(self, key: str, plugin) -> str:
+        prompt = self.generate(plugin)
+        self._count("generated")
+        if self.pool_size > 0:
+            self._add(key, prompt)
+        return prompt
+
+    def get(self, plugin, fresh: bool = False):
+        # returns (prompt, source) where source is "pool", "generated" or "coalesced"
+        key = plugin.name
+        if self.pool_size > 0 and not fresh:
+            pooled = self._pooled(key)
+            if len(pooled) >= self.pool_size:
+                self._count("reused")
+                return random.choice(pooled), "pool"
+
+        prompt, shared = self._flight.do(key, lambda: self._generate(key, plugin))
+        if shared:
+            self._count("coalesced")
+        return prompt, "coalesced" if shared else "generated"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "max_age": self.max_age,
+                "shared_enabled": self.collection is not None,
+                **self._stats,
+            }
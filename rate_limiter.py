@@ -0,0 +1,132 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Tuple
+
+from pymongo import ReturnDocument
+
+
+class InMemoryRateLimiter:
+    """Sliding-window limiter kept in process memory.
+
+    Every key owns a deque of (sent_at, label) entries ordered by time, so
+    admitting a request only evicts expired entries from the left and appends
+    on the right. Each entry is evicted at most once, which keeps admit
+    amortized O(1) no matter how large the window limit is.
+    """
+
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window = timedelta(seconds=window_seconds)
+        self._buckets: Dict[str, Deque[Tuple[datetime, str]]] = {}
+        self._total_use: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def admit(self, key: str, label: str) -> bool:
+        now = datetime.utcnow()
+        cutoff = now - self.window
+        with self._lock:
+            bucket = self._buckets.setdefault(key, deque())
+            # evict requests that fell out of the window
+            while bucket and bucket[0][0] <= cutoff:
+                bucket.popleft()
+            if len(bucket) >= self.limit:
+                return False
+            bucket.append((now, label))
+            self._total_use[key] = self._total_use.get(key, 0) + 1
+            return True
+
+    def usage(self, key: str) -> dict:
+        with self._lock:
+            bucket = list(self._buckets.get(key, ()))
+            total_use = self._total_use.get(key, 0)
+        return {
+            "total_use": total_use,
+            "bucket": [{"date_sent": date_sent, "plugin_name": plugin_name} for date_sent, plugin_name in bucket],
+        }
+
+
+class MongoRateLimiter:
+    """Sliding-window counter shared by every worker through MongoDB.
+
+    Requests are counted per fixed window with atomic `$inc` upserts, and the
+    sliding count is estimated as the current window plus the overlapping
+    share of the previous one. A request that pushes the estimate over the
+    limit is rolled back with a compensating decrement, so the limit holds
+    across gunicorn workers and dynos without any read-modify-write race.
+    """
+
+    def __init__(self, collection, limit: int, window_seconds: int):
+        self.collection = collection
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._indexes_ready = False
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        # window documents clean themselves up once they can no longer be read
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def admit(self, key: str, label: str) -> bool:
+        self._ensure_indexes()
+        now = datetime.utcnow()
+        # naive utcnow() would be read as local time, skewing windows and expiry on non-UTC hosts
+        timestamp = now.replace(tzinfo=timezone.utc).timestamp()
+        window_index = int(timestamp // self.window_seconds)
+        elapsed_fraction = (timestamp % self.window_seconds) / self.window_seconds
+
+        previous = self.collection.find_one({"_id": f"{key}:{window_index - 1}"}) or {}
+        current = self.collection.find_one_and_update(
+            {"_id": f"{key}:{window_index}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "key": key,
+                    "window": window_index,
+                    "expires_at": datetime.utcfromtimestamp((window_index + 2) * self.window_seconds),
+                },
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        estimate = previous.get("count", 0) * (1 - elapsed_fraction) + current["count"]
+        if estimate > self.limit:
+            # give the slot back so rejected requests don't count against the window
+            self.collection.update_one({"_id": current["_id"]}, {"$inc": {"count": -1}})
+            return False
+
+        self.collection.update_one(
+            {"_id": f"{key}:total"},
+            {"$inc": {"total_use": 1}, "$set": {"key": key, "last_plugin_name": label, "last_date_sent": now}},
+            upsert=True,
+        )
+        return True
+
+    def usage(self, key: str) -> dict:
+        timestamp = datetime.utcnow().replace(tzinfo=timezone.utc).timestamp()
+        window_index = int(timestamp // self.window_seconds)
+        elapsed_fraction = (timestamp % self.window_seconds) / self.window_seconds
+        counts = {
+            doc["window"]: doc.get("count", 0)
+            for doc in self.collection.find({"key": key, "window": {"$in": [window_index - 1, window_index]}})
+        }
+        totals = self.collection.find_one({"_id": f"{key}:total"}) or {}
+        return {
+            "total_use": totals.get("total_use", 0),
+            "window_count": round(counts.get(window_index - 1, 0) * (1 - elapsed_fraction) + counts.get(window_index, 0)),
+            "last_plugin_name": totals.get("last_plugin_name"),
+            "last_date_sent": totals.get("last_date_sent"),
+        }
+
+
+def create_rate_limiter(backend: str, limit: int, window_seconds: int, db=None):
+    if backend == "memory":
+        return InMemoryRateLimiter(limit, window_seconds)
+    if backend == "mongo":
+        if db is None:
+            raise ValueError("The mongo rate limiter backend requires a database")
+        return MongoRateLimiter(db["openplugin-rate-limits"], limit, window_seconds)
+    raise ValueError(f"Unknown rate limiter backend \"{backend}\"")
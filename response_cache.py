@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import PyMongoError
+
+from cache import TTLCache
+
+
+def request_cache_key(*parts) -> str:
+    # canonical JSON so key order and whitespace in the request body don't matter
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache for deterministic responses.
+
+    Lookups hit the in-process TTLCache first and fall back to a MongoDB
+    collection shared by every worker, promoting shared hits into memory for
+    the rest of their lifetime. MongoDB errors are counted and treated as
+    misses so the cache can never fail a request.
+    """
+
+    def __init__(self, memory: TTLCache, collection=None):
+        self.memory = memory
+        self.collection = collection
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+        self._stats = {"shared_hits": 0, "shared_misses": 0, "shared_errors": 0, "writes": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def get(self, key: str):
+        missing = object()
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            return value
+        if self.collection is None:
+            return None
+
+        try:
+            self._ensure_indexes()
+            doc = self.collection.find_one({"_id": key})
+        except PyMongoError:
+            self._count("shared_errors")
+            return None
+        now = datetime.utcnow()
+        # the TTL monitor only runs once a minute, so check expiry ourselves
+        if not doc or doc["expires_at"] <= now:
+            self._count("shared_misses")
+            return None
+        self._count("shared_hits")
+        self.memory.set(key, doc["response"], ttl=(doc["expires_at"] - now).total_seconds())
+        return doc["response"]
+
+    def set(self, key: str, response, ttl: float, label: Optional[str] = None):
+        self.memory.set(key, response, ttl=ttl)
+        self._count("writes")
+        if self.collection is None:
+            return
+        try:
+            self._ensure_indexes()
+            self.collection.replace_one(
+                {"_id": key},
+                {"response": response, "label": label, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True,
+            )
+        except PyMongoError:
+            self._count("shared_errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"memory": self.memory.stats(), "shared_enabled": self.collection is not None, **self._stats}
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, load_classes
+
+
+def make_controller(max_concurrent=1, **overrides):
+    classes = {
+        "chat": {"priority": 0, "limit": 4, "max_queue": 4, "queue_timeout": 2},
+        "eval": {"priority": 2, "limit": 4, "max_queue": 4, "queue_timeout": 2},
+    }
+    for name, config in overrides.items():
+        classes[name] = {**classes.get(name, {}), **config}
+    return AdmissionController(classes, max_concurrent=max_concurrent)
+
+
+def queue(controller, name, admitted):
+    # starts a request that records its name once admitted, then waits for it to queue up
+    def run():
+        ticket = controller.acquire(name)
+        admitted.append(name)
+        controller.release(ticket)
+
+    thread = threading.Thread(target=run)
+    before = controller.stats()["classes"][name]["queued"]
+    thread.start()
+    deadline = time.monotonic() + 1
+    while controller.stats()["classes"][name]["queued"] == before:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    return thread
+
+
+def test_admits_immediately_when_there_is_room():
+    controller = make_controller(max_concurrent=2)
+    first = controller.acquire("eval")
+    second = controller.acquire("chat")
+    assert controller.stats()["running"] == 2
+    controller.release(first)
+    controller.release(second)
+    assert controller.stats()["running"] == 0
+
+
+def test_queue_is_served_by_priority_then_arrival():
+    controller = make_controller()
+    blocker = controller.acquire("eval")
+    admitted = []
+    threads = [queue(controller, "eval", admitted), queue(controller, "chat", admitted), queue(controller, "eval", admitted), queue(controller, "chat", admitted)]
+    controller.release(blocker)
+    for thread in threads:
+        thread.join()
+    assert admitted == ["chat", "chat", "eval", "eval"]
+
+
+def test_class_at_its_limit_does_not_block_others():
+    controller = make_controller(max_concurrent=2, chat={"limit": 1})
+    running_chat = controller.acquire("chat")
+    admitted = []
+    waiting_chat = queue(controller, "chat", admitted)
+    # chat is at its own limit, so the free slot goes to eval right away
+    ticket = controller.acquire("eval")
+    assert admitted == []
+    controller.release(running_chat)
+    waiting_chat.join()
+    assert admitted == ["chat"]
+    controller.release(ticket)
+
+
+def test_full_queue_is_rejected_with_429():
+    controller = make_controller(eval={"max_queue": 1})
+    blocker = controller.acquire("eval")
+    admitted = []
+    waiting = queue(controller, "eval", admitted)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("eval")
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after >= 1
+    controller.release(blocker)
+    waiting.join()
+    assert admitted == ["eval"]
+
+
+def test_queue_timeout_is_rejected_with_503():
+    controller = make_controller(eval={"queue_timeout": 0.05})
+    blocker = controller.acquire("eval")
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("eval")
+    assert rejected.value.status_code == 503
+    assert time.monotonic() - start >= 0.05
+    # the timed out request left the queue
+    assert controller.stats()["classes"]["eval"]["queued"] == 0
+    controller.release(blocker)
+    controller.release(controller.acquire("eval"))
+
+
+def test_concurrency_never_exceeds_limits():
+    controller = make_controller(max_concurrent=3, chat={"limit": 2, "max_queue": 100, "queue_timeout": 5},
+                                 eval={"limit": 2, "max_queue": 100, "queue_timeout": 5})
+    lock = threading.Lock()
+    running = {"chat": 0, "eval": 0, "total": 0}
+    peaks = {"chat": 0, "eval": 0, "total": 0}
+
+    def work(name):
+        ticket = controller.acquire(name)
+        with lock:
+            for key in (name, "total"):
+                running[key] += 1
+                peaks[key] = max(peaks[key], running[key])
+        time.sleep(0.005)
+        with lock:
+            running[name] -= 1
+            running["total"] -= 1
+        controller.release(ticket)
+
+    threads = [threading.Thread(target=work, args=("chat" if index % 2 else "eval",)) for index in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peaks["total"] <= 3 and peaks["chat"] <= 2 and peaks["eval"] <= 2
+    assert controller.stats()["running"] == 0
+
+
+def test_load_classes_merges_overrides():
+    classes = load_classes({"eval": {"limit": 1}, "batch": {"priority": 4, "limit": 1, "max_queue": 1, "queue_timeout": 1}})
+    assert classes["eval"]["limit"] == 1
+    assert classes["eval"]["max_queue"] == load_classes()["eval"]["max_queue"]
+    assert classes["batch"]["priority"] == 4
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from cache import SingleFlight, TTLCache
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+    results = []
+
+    def load():
+        calls.append(1)
+        release.wait(1)
+        return "manifest"
+
+    def call():
+        results.append(flight.do("todo", load))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # let every thread reach the flight before the leader finishes
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("manifest", False)] + [("manifest", True)] * 7
+
+
+def test_single_flight_shares_exceptions_and_forgets_them():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait(1)
+        raise ValueError("manifest unavailable")
+
+    def call():
+        try:
+            flight.do("todo", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert errors == ["manifest unavailable"] * 2
+    # a failed call is not cached, the next one runs again
+    assert flight.do("todo", lambda: "manifest") == ("manifest", False)
+
+
+def test_get_or_load_loads_once_for_concurrent_misses():
+    cache = TTLCache(max_entries=10, ttl=60)
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.1)
+        return "plugin"
+
+    threads = [threading.Thread(target=cache.get_or_load, args=("todo", load)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert cache.get("todo") == "plugin"
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_entries_expire():
+    cache = TTLCache(max_entries=10, ttl=0.05)
+    cache.set("todo", "plugin")
+    cache.set("weather", "plugin", ttl=60)
+    time.sleep(0.06)
+    assert cache.get("todo") is None
+    assert cache.get("weather") == "plugin"
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_can_depend_on_the_loaded_value():
+    cache = TTLCache(max_entries=10, ttl=60)
+    ttl = lambda value: None if value is not None else 0.05
+    assert cache.get_or_load("missing", lambda: None, ttl=ttl) is None
+    assert cache.get_or_load("todo", lambda: "plugin", ttl=ttl) == "plugin"
+    time.sleep(0.06)
+    assert cache.get_or_load("missing", lambda: "found", ttl=ttl) == "found"
+    assert cache.get("todo") == "plugin"
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_byte_budget_is_enforced():
+    cache = TTLCache(max_entries=10, ttl=60, max_bytes=10, sizeof=len)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "123")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+
+def test_load_errors_are_not_cached():
+    cache = TTLCache(max_entries=10, ttl=60)
+
+    def fail():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("todo", fail)
+    assert cache.get_or_load("todo", lambda: "plugin") == "plugin"
+    assert cache.stats()["load_errors"] == 1
@@ -0,0 +1,32 @@
+from http_pool import OutboundHTTP
+
+
+def make_outbound(**overrides):
+    config = {"pool_connections": 1, "pool_maxsize": 1, "timeout": 1, "retries": 0, "backoff_factor": 0}
+    return OutboundHTTP(**{**config, **overrides})
+
+
+def test_tracks_each_host():
+    outbound = make_outbound()
+    outbound.record("https://todo.example/todos", 0.01, error=False)
+    outbound.record("https://todo.example/todos", 0.03, error=True)
+    stats = outbound.stats()
+    assert stats["todo.example"]["requests"] == 2
+    assert stats["todo.example"]["errors"] == 1
+    assert "other" not in stats
+
+
+def test_least_recently_used_hosts_fold_into_other():
+    outbound = make_outbound(max_hosts=2)
+    outbound.record("https://a.example/", 0.01, error=True)
+    outbound.record("https://b.example/", 0.01, error=False)
+    # touching a makes b the least recently used host
+    outbound.record("https://a.example/", 0.01, error=False)
+    for host in ("c", "d", "e"):
+        outbound.record(f"https://{host}.example/", 0.01, error=False)
+    stats = outbound.stats()
+    assert set(stats) == {"d.example", "e.example", "other"}
+    # nothing is lost, evicted hosts keep counting under "other"
+    assert stats["other"]["requests"] == 4
+    assert stats["other"]["errors"] == 1
+    assert sum(snapshot["requests"] for snapshot in stats.values()) == 6
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+import pytest
+
+from lazy import Lazy
+
+
+class Client:
+    created = 0
+
+    def __init__(self):
+        Client.created += 1
+        self.generation = Client.created
+
+    def __getitem__(self, name):
+        return {"client": self.generation, "name": name}
+
+
+@pytest.fixture(autouse=True)
+def reset_count():
+    Client.created = 0
+
+
+def test_nothing_is_built_until_first_use():
+    client = Lazy(Client)
+    collection = client["openplugin-io"]
+    assert Client.created == 0
+    assert not client.resolved
+    assert collection.resolve() == {"client": 1, "name": "openplugin-io"}
+    assert client.resolved
+    assert client.generation == 1
+
+
+def test_concurrent_first_use_builds_once():
+    def slow_client():
+        time.sleep(0.05)
+        return Client()
+
+    client = Lazy(slow_client)
+    threads = [threading.Thread(target=client.resolve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Client.created == 1
+
+
+def test_children_follow_a_reset_parent():
+    client = Lazy(Client)
+    collection = client["openplugin-io"]
+    assert collection.resolve()["client"] == 1
+    client.reset()
+    assert not collection.resolved
+    assert collection.resolve()["client"] == 2
+    assert Client.created == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_builds_its_own_target():
+    client = Lazy(Client, reset_after_fork=True)
+    collection = client["openplugin-io"]
+    collection.resolve()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        os.write(write, f"{client.resolved},{collection.resolve()['client']}".encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        child = pipe.read()
+    os.waitpid(pid, 0)
+    # the child started unresolved and built a second client; the parent keeps its own
+    assert child == "False,2"
+    assert client.resolved and collection.resolve()["client"] == 1
@@ -0,0 +1,171 @@
+import json
+
+import pytest
+import requests
+
+from manifest_validation import ManifestValidator, not_modified, validate_manifest, validate_openapi
+
+ROOT = "https://todo.example"
+
+MANIFEST = {
+    "name_for_model": "todo",
+    "description_for_human": "Manage your todo list",
+    "description_for_model": "Plugin for managing a todo list",
+    "auth": {"type": "none"},
+    "logo_url": "https://todo.example/logo.png",
+    "api": {"url": "/openapi.json"},
+}
+
+OPENAPI = {"openapi": "3.0.1", "info": {"title": "Todo"}, "paths": {"/todos": {"get": {}}}}
+
+OPENAPI_YAML = b"""openapi: 3.0.1
+info:
+  title: Todo
+paths:
+  /todos:
+    get: {}
+"""
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Serves documents by url, with ETags and 304s for conditional requests."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, headers or {}))
+        if url not in self.documents:
+            return FakeResponse(404)
+        document = self.documents[url]
+        body = document if isinstance(document, bytes) else json.dumps(document).encode()
+        etag = f'"{len(body)}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return FakeResponse(304, headers={"ETag": etag})
+        return FakeResponse(200, body, {"ETag": etag, "Content-Length": str(len(body))})
+
+
+def make_validator(documents, **overrides):
+    config = {"max_entries": 16, "revalidate_after": 0, "max_bytes": 1024 * 1024, "max_document_bytes": 64 * 1024}
+    session = FakeSession(documents)
+    return ManifestValidator(session, **{**config, **overrides}), session
+
+
+def plugin_documents(manifest=MANIFEST, openapi=OPENAPI, openapi_path="/openapi.json"):
+    return {f"{ROOT}/.well-known/ai-plugin.json": manifest, f"{ROOT}{openapi_path}": openapi}
+
+
+def test_validate_manifest_lists_every_error():
+    assert validate_manifest(MANIFEST) == []
+    manifest = {key: value for key, value in MANIFEST.items() if key not in ("logo_url", "api")}
+    manifest["name_for_model"] = " "
+    manifest["auth"] = {}
+    assert validate_manifest(manifest) == [
+        "manifest.logo_url is required",
+        "manifest.api is required",
+        "manifest.name_for_model must not be empty",
+        "manifest.auth.type is required",
+    ]
+    assert validate_manifest([]) == ["manifest must be an object"]
+
+
+def test_validate_openapi_lists_every_error():
+    assert validate_openapi(OPENAPI) == []
+    assert validate_openapi({"paths": {}}) == ["openapi.openapi is required", "openapi.paths must not be empty"]
+    assert validate_openapi({"openapi": "3.0.1", "paths": []}) == ["openapi.paths must be an object"]
+    assert validate_openapi(None) == ["openapi must be an object"]
+
+
+def test_valid_plugin():
+    validator, _ = make_validator(plugin_documents())
+    etag, body, status_code, cached = validator.evaluate(ROOT)
+    assert status_code == 200
+    assert not cached
+    assert body["namespace"] == "todo"
+    assert body["domain"] == ROOT
+    assert body["status"] == "tentative"
+
+
+def test_yaml_spec_resolved_relative_to_root():
+    validator, session = make_validator(plugin_documents(
+        manifest={**MANIFEST, "api": {"url": "specs/openapi.yaml"}}, openapi=OPENAPI_YAML, openapi_path="/specs/openapi.yaml",
+    ))
+    _, body, status_code, _ = validator.evaluate(ROOT)
+    assert status_code == 200, body
+    assert session.requests[-1][0] == f"{ROOT}/specs/openapi.yaml"
+
+
+def test_invalid_plugin_reports_errors():
+    validator, _ = make_validator(plugin_documents(manifest={**MANIFEST, "description_for_model": ""}))
+    _, body, status_code, _ = validator.evaluate(ROOT)
+    assert status_code == 400
+    assert body == {"error": "Invalid plugin: manifest.description_for_model must not be empty"}
+
+    validator, _ = make_validator(plugin_documents(openapi=b"openapi: [unclosed"))
+    _, body, status_code, _ = validator.evaluate(ROOT)
+    assert status_code == 400
+    assert body["error"].startswith("Invalid plugin: openapi could not be parsed")
+
+
+def test_oversized_documents_are_refused():
+    validator, _ = make_validator(plugin_documents(openapi={**OPENAPI, "x-padding": "a" * 2048}), max_document_bytes=1024)
+    with pytest.raises(ValueError, match="larger than 1024 bytes"):
+        validator.evaluate(ROOT)
+
+
+def test_oversized_documents_without_content_length_are_refused():
+    validator, session = make_validator({}, max_document_bytes=1024)
+    session.get = lambda url, **kwargs: FakeResponse(200, b"a" * 4096)
+    with pytest.raises(ValueError, match="larger than 1024 bytes"):
+        validator.fetch(f"{ROOT}/.well-known/ai-plugin.json")
+
+
+def test_etag_is_stable_across_unchanged_fetches():
+    documents = plugin_documents()
+    validator, session = make_validator(documents)
+    etag, _, _, cached = validator.evaluate(ROOT)
+    assert not cached
+    again, _, _, cached = validator.evaluate(ROOT)
+    assert again == etag
+    assert cached
+    # the second round was revalidated with the origin's ETag and answered with a 304
+    assert all(headers.get("If-None-Match") for _, headers in session.requests[2:])
+
+    documents[f"{ROOT}/openapi.json"] = {**OPENAPI, "info": {"title": "Todo v2"}}
+    changed, _, _, cached = validator.evaluate(ROOT)
+    assert changed != etag
+    assert not cached
+
+
+def test_not_modified_only_for_valid_results():
+    validator, _ = make_validator(plugin_documents())
+    etag, _, status_code, _ = validator.evaluate(ROOT)
+    assert not_modified(etag, status_code, etag)
+    assert not_modified(etag, status_code, f'"other", {etag}')
+    assert not not_modified(etag, status_code, '"other"')
+    assert not not_modified(etag, status_code, None)
+
+    validator, _ = make_validator(plugin_documents(manifest={**MANIFEST, "auth": {}}))
+    etag, _, status_code, _ = validator.evaluate(ROOT)
+    assert status_code == 400
+    assert not not_modified(etag, status_code, etag)
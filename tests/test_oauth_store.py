@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from oauth_store import OAuthClientConfigs, create_state_store
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["openplugin-io"]
+
+
+def test_client_config_is_cached(db):
+    db["openplugin-auth"].insert_one({"domain": "todo.example", "oauth": {"client_id": "id"}})
+    configs = OAuthClientConfigs(db["openplugin-auth"], ttl=300, max_entries=10)
+    assert configs.get("todo.example")["oauth"]["client_id"] == "id"
+    db["openplugin-auth"].delete_many({})
+    assert configs.get("todo.example")["oauth"]["client_id"] == "id"
+    assert configs.stats()["loads"] == 1
+
+
+def test_unknown_domain_expires_despite_polling(db):
+    configs = OAuthClientConfigs(db["openplugin-auth"], ttl=300, max_entries=10, negative_ttl=0.2)
+    assert configs.get("todo.example") is None
+    db["openplugin-auth"].insert_one({"domain": "todo.example"})
+    # lookups while the miss is cached must not extend it
+    deadline = time.monotonic() + 0.5
+    while configs.get("todo.example") is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def states(request, db):
+    return create_state_store(request.param, ttl=60, db=db)
+
+
+def test_state_is_consumed_once(states):
+    states.put("state", {"client_domain": "todo.example"}, "nonce")
+    assert states.consume("state", "nonce") == {"client_domain": "todo.example"}
+    assert states.consume("state", "nonce") is None
+
+
+def test_state_is_consumed_once_under_concurrency(states):
+    states.put("state", {"client_domain": "todo.example"}, "nonce")
+    results = []
+    barrier = threading.Barrier(8)
+
+    def consume():
+        barrier.wait()
+        results.append(states.consume("state", "nonce"))
+
+    threads = [threading.Thread(target=consume) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [result for result in results if result] == [{"client_domain": "todo.example"}]
+
+
+def test_state_needs_the_browser_nonce(states):
+    states.put("state", {"client_domain": "todo.example"}, "nonce")
+    assert states.consume("state", None) is None
+    assert states.consume("state", "someone-else") is None
+    # a wrong nonce doesn't burn the flow for its owner
+    assert states.consume("state", "nonce") == {"client_domain": "todo.example"}
+
+
+def test_expired_state_is_refused(db):
+    for backend in ("memory", "mongo"):
+        states = create_state_store(backend, ttl=0.05, db=db)
+        states.put(f"{backend}-state", {"client_domain": "todo.example"}, "nonce")
+        time.sleep(0.1)
+        assert states.consume(f"{backend}-state", "nonce") is None
@@ -0,0 +1,68 @@
+import mongomock
+
+from plugin_directory import PluginDirectoryRefresher
+from usage_ledger import UsageLedger
+
+DIRECTORY = {"todo": "https://todo.example", "weather": "https://weather.example", "zapier": "https://zapier.example"}
+
+
+class FakeMemo:
+    def __init__(self):
+        self.plugins = {}
+        self.plugins_directory = None
+
+    def init_openplugin(self, plugin_name):
+        return f"plugin:{plugin_name}"
+
+
+class FakeResponse:
+    status_code = 200
+    ok = True
+    headers = {}
+
+    def json(self):
+        return DIRECTORY
+
+
+class FakeSession:
+    def get(self, url, headers=None, timeout=None):
+        return FakeResponse()
+
+
+def make_refresher(**overrides):
+    config = {"interval": 600, "warm_top_n": 2, "session": FakeSession()}
+    return PluginDirectoryRefresher(FakeMemo(), **{**config, **overrides})
+
+
+def test_fresh_worker_warms_from_persisted_usage():
+    totals = mongomock.MongoClient().db["openplugin-usage-totals"]
+    ledger = UsageLedger(mongomock.MongoClient().db["openplugin-usage-hourly"], totals, flush_interval=10, flush_size=500)
+    for token, plugin_name in [("a", "zapier"), ("a", "zapier"), ("b", "zapier"), ("b", "weather"), ("b", "https://x.example")]:
+        ledger.record(token, plugin_name)
+    ledger.flush()
+
+    refresher = make_refresher(popular_plugins=ledger.top_plugins)
+    refresher.refresh()
+    status = refresher.status()
+    assert status["ready"]
+    assert status["warmed"] == ["zapier", "weather"]
+    assert status["warm_note"] is None
+
+
+def test_configured_and_local_usage_rank_before_persisted_usage():
+    refresher = make_refresher(warm_namespaces=["todo"], popular_plugins=lambda limit: ["zapier", "weather"])
+    refresher.record_use("weather")
+    refresher.refresh()
+    assert refresher.status()["warmed"] == ["todo", "weather"]
+
+
+def test_popular_plugins_failure_does_not_block_readiness():
+    def popular_plugins(limit):
+        raise RuntimeError("mongo down")
+
+    refresher = make_refresher(popular_plugins=popular_plugins)
+    refresher.refresh()
+    status = refresher.status()
+    assert status["ready"]
+    assert status["warmed"] == []
+    assert status["warm_note"].startswith("nothing to warm")
@@ -0,0 +1,152 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from plugin_health import CircuitBreaker, CircuitOpen, PluginHealth
+
+
+def make_breaker(**overrides):
+    config = {"failure_threshold": 3, "open_seconds": 0.05, "slow_call_seconds": 1}
+    return CircuitBreaker(**{**config, **overrides})
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow("todo")
+        breaker.record(0.01, failed=True)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker()
+    breaker.record(0.01, failed=True)
+    breaker.record(0.01, failed=True)
+    breaker.record(0.01, failed=False)
+    assert breaker.state == "closed"
+    trip(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow("todo")
+
+
+def test_slow_calls_count_as_failures():
+    breaker = make_breaker(slow_call_seconds=0.5)
+    for _ in range(3):
+        breaker.record(0.6, failed=False)
+    assert breaker.state == "open"
+
+
+def test_open_half_open_closed():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(0.06)
+    assert breaker.allow("todo") is True
+    assert breaker.state == "half_open"
+    # only a single probe is let through
+    with pytest.raises(CircuitOpen):
+        breaker.allow("todo")
+    breaker.record(0.01, failed=False, probe=True)
+    assert breaker.state == "closed"
+    assert breaker.allow("todo") is False
+
+
+def test_failed_probe_reopens():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(0.06)
+    assert breaker.allow("todo") is True
+    breaker.record(0.01, failed=True, probe=True)
+    assert breaker.state == "open"
+    assert breaker.snapshot()["opened"] == 2
+
+
+def test_late_results_do_not_close_an_open_breaker():
+    breaker = make_breaker()
+    trip(breaker)
+    # a call admitted before the trip finishes successfully
+    breaker.record(0.01, failed=False)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.allow("todo")
+    breaker.record(0.01, failed=False)
+    assert breaker.state == "half_open"
+    assert breaker.snapshot()["calls"] == 5
+
+
+def test_stale_probe_is_replaced():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(0.06)
+    assert breaker.allow("todo") is True
+    time.sleep(0.06)
+    assert breaker.allow("todo") is True
+
+
+def test_breakers_are_bounded():
+    health = PluginHealth(failure_threshold=1, open_seconds=60, slow_call_seconds=1, max_breakers=2)
+    health.breaker("a").record(0.01, failed=True)
+    health.breaker("b")
+    health.breaker("c")
+    # closed breakers go first, so the open one survives
+    assert sorted(health.stats()["plugins"]) == ["a", "c"]
+
+
+class SlowFirstHandler(BaseHTTPRequestHandler):
+    paths = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        if len(self.paths) == 1:
+            time.sleep(0.5)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def slow_first_server():
+    SlowFirstHandler.paths = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowFirstHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+class Plugin:
+    def __init__(self, call_api_fn):
+        self.call_api_fn = call_api_fn
+
+
+def test_hedged_get_with_path_params_is_sent_twice(slow_first_server):
+    from oplangchain.chains.openai_functions.openapi import openapi_spec_to_openai_fn
+    from oplangchain.utilities.openapi import OpenAPISpec
+
+    spec = OpenAPISpec.from_spec_dict({
+        "openapi": "3.1.0",
+        "info": {"title": "todos", "version": "1"},
+        "servers": [{"url": f"http://127.0.0.1:{slow_first_server.server_address[1]}"}],
+        "paths": {"/todos/{todo_id}": {"get": {
+            "operationId": "getTodo",
+            "parameters": [{"name": "todo_id", "in": "path", "required": True, "schema": {"type": "string"}}],
+            "responses": {"200": {"description": "ok"}},
+        }}},
+    })
+    _, call_api_fn = openapi_spec_to_openai_fn(spec)
+    health = PluginHealth(failure_threshold=3, open_seconds=60, slow_call_seconds=5, hedge=True, hedge_min_samples=1)
+    health.breaker("todo").record(0.05, failed=False)
+
+    plugin = health.guard(Plugin(call_api_fn), "todo")
+    start = time.perf_counter()
+    response = plugin.call_api_fn("getTodo", {"path_params": {"todo_id": "7"}}, None, params=None)
+
+    assert response.status_code == 200
+    assert time.perf_counter() - start < 0.4
+    assert SlowFirstHandler.paths == ["/todos/7", "/todos/7"]
+    assert health.stats()["plugins"]["todo"]["hedged"] == 1
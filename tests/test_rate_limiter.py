@@ -0,0 +1,103 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import rate_limiter
+from rate_limiter import InMemoryRateLimiter, MongoRateLimiter
+
+
+class Clock:
+    def __init__(self, start: datetime):
+        self.now = start
+
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # close to the real time, mongomock expires TTL-indexed documents against the wall clock
+    clock = Clock(datetime.utcnow().replace(second=0, microsecond=0))
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return clock.now
+
+        @staticmethod
+        def utcfromtimestamp(timestamp):
+            # plain datetimes, which is what gets stored in Mongo
+            return datetime.utcfromtimestamp(timestamp)
+
+    monkeypatch.setattr(rate_limiter, "datetime", FrozenDatetime)
+    return clock
+
+
+def test_memory_limit_within_window(clock):
+    limiter = InMemoryRateLimiter(limit=3, window_seconds=60)
+    assert [limiter.admit("token", "todo") for _ in range(4)] == [True, True, True, False]
+    assert limiter.usage("token")["total_use"] == 3
+
+
+def test_memory_window_slides(clock):
+    limiter = InMemoryRateLimiter(limit=2, window_seconds=60)
+    limiter.admit("token", "todo")
+    clock.advance(30)
+    limiter.admit("token", "todo")
+    assert not limiter.admit("token", "todo")
+    # the first request leaves the window, the second one is still in it
+    clock.advance(31)
+    assert limiter.admit("token", "todo")
+    assert not limiter.admit("token", "todo")
+    assert [entry["date_sent"] for entry in limiter.usage("token")["bucket"]] == [
+        clock.now - timedelta(seconds=31), clock.now]
+
+
+def test_memory_keys_are_independent(clock):
+    limiter = InMemoryRateLimiter(limit=1, window_seconds=60)
+    assert limiter.admit("a", "todo")
+    assert limiter.admit("b", "todo")
+    assert not limiter.admit("a", "todo")
+
+
+def test_memory_limit_holds_under_concurrency():
+    limiter = InMemoryRateLimiter(limit=50, window_seconds=60)
+    admitted = []
+    barrier = threading.Barrier(8)
+
+    def hammer():
+        barrier.wait()
+        admitted.extend(limiter.admit("token", "todo") for _ in range(25))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert admitted.count(True) == 50
+
+
+@pytest.fixture
+def collection():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient()["openplugin-io"]["openplugin-rate-limits"]
+
+
+def test_mongo_limit_and_rollback(clock, collection):
+    limiter = MongoRateLimiter(collection, limit=2, window_seconds=60)
+    assert [limiter.admit("token", "todo") for _ in range(3)] == [True, True, False]
+    usage = limiter.usage("token")
+    # the rejected request was given back
+    assert usage["window_count"] == 2
+    assert usage["total_use"] == 2
+    assert usage["last_plugin_name"] == "todo"
+
+
+def test_mongo_previous_window_is_weighted(clock, collection):
+    limiter = MongoRateLimiter(collection, limit=4, window_seconds=60)
+    for _ in range(4):
+        assert limiter.admit("token", "todo")
+    # halfway through the next window half of the previous one still counts
+    clock.advance(90)
+    assert [limiter.admit("token", "todo") for _ in range(3)] == [True, True, False]
@@ -0,0 +1,95 @@
+from token_budget import DEFAULT_CONTEXT_TOKENS, TokenBudget
+
+# an unknown model gets the default context, so the budget is easy to pin down
+MODEL = "test-model"
+
+
+def message(role, content):
+    return {"role": role, "content": content}
+
+
+def conversation(turns):
+    messages = [message("system", "You are a helpful assistant. " * 5)]
+    for turn in range(turns):
+        messages.append(message("user", f"question {turn} " + "lorem ipsum dolor sit amet " * 10))
+        messages.append(message("assistant", f"answer {turn} " + "consectetur adipiscing elit " * 10))
+    messages.append(message("user", "and the latest question?"))
+    return messages
+
+
+def budget_for(tokens):
+    # a budget of exactly `tokens` for MODEL with no reserve_tokens
+    return TokenBudget(completion_reserve=DEFAULT_CONTEXT_TOKENS - tokens)
+
+
+def test_fits_untouched():
+    messages = conversation(2)
+    trimmed, report = TokenBudget(completion_reserve=0).trim(messages, MODEL)
+    assert trimmed == messages
+    assert report["messages_dropped"] == 0
+    assert report["tokens_saved"] == 0
+    assert report["tokens_after"] == report["tokens_before"]
+
+
+def test_drops_oldest_turns_first_and_keeps_system():
+    messages = conversation(6)
+    counts = TokenBudget(0).count_messages(messages, MODEL)
+    # room for the system message, the last two turns and the latest message
+    limit = counts[0] + sum(counts[-5:])
+    trimmed, report = budget_for(limit).trim(messages, MODEL)
+    assert trimmed == [messages[0]] + messages[-5:]
+    assert report["messages_dropped"] == len(messages) - 6
+    assert report["tokens_after"] == limit
+    assert report["tokens_after"] <= report["budget_tokens"] == limit
+
+
+def test_latest_message_survives_an_exhausted_budget():
+    messages = conversation(3)
+    trimmed, report = budget_for(1).trim(messages, MODEL)
+    # system messages and the latest message are never dropped, even over budget
+    assert trimmed == [messages[0], messages[-1]]
+    assert report["tokens_after"] > report["budget_tokens"]
+
+
+def test_system_messages_mid_conversation_are_kept():
+    messages = conversation(3)
+    messages.insert(3, message("system", "Plugin response: {}"))
+    trimmed, _ = budget_for(1).trim(messages, MODEL)
+    assert [m for m in trimmed if m["role"] == "system"] == [messages[0], messages[3]]
+    assert trimmed[-1] == messages[-1]
+
+
+def test_reserve_accounting():
+    budget = TokenBudget(completion_reserve=512)
+    _, report = budget.trim(conversation(1), MODEL, reserve_tokens=100)
+    assert report["reserved_tokens"] == 612
+    assert report["budget_tokens"] == DEFAULT_CONTEXT_TOKENS - 612
+    _, report = budget.trim(conversation(1), MODEL, reserve_tokens=100, completion_reserve=0)
+    assert report["reserved_tokens"] == 100
+    # a reserve larger than the context leaves no budget rather than a negative one
+    _, report = budget.trim(conversation(1), MODEL, reserve_tokens=DEFAULT_CONTEXT_TOKENS)
+    assert report["budget_tokens"] == 0
+
+
+def test_tokens_saved_report():
+    messages = conversation(6)
+    budget = TokenBudget(0)
+    counts = budget.count_messages(messages, MODEL)
+    trimmed, report = budget_for(counts[0] + sum(counts[-3:])).trim(messages, MODEL)
+    dropped = len(messages) - len(trimmed)
+    assert report["tokens_before"] == sum(counts)
+    assert report["tokens_saved"] == report["tokens_before"] - report["tokens_after"]
+    assert report["tokens_saved"] == sum(counts[1:1 + dropped])
+    assert report["messages_dropped"] == dropped
+    assert report["model"] == MODEL
+
+
+def test_prefix_memo_returns_the_same_counts():
+    budget = TokenBudget(0)
+    messages = conversation(3)
+    first = budget.count_messages(messages, MODEL)
+    # a conversation that grows by a turn reuses the memoized prefix
+    grown = messages + [message("assistant", "a brand new answer")]
+    assert budget.count_messages(grown, MODEL)[:-1] == first
+    assert budget.count_messages(messages, MODEL) == first
+    assert first == [TokenBudget(0).count_message(m, MODEL) for m in messages]
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Tuple
+
+from openplugincore.utils.constants import openai_models_info
+from openplugincore.utils.prompting import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # optional, falls back to openplugincore's estimate
+    tiktoken = None
+
+# every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_CONTEXT_TOKENS = 4096
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+
+def count_text_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class TokenBudget:
+    """Counts chat tokens per message and trims history to fit a model's context.
+
+    Token counts are memoized per message and per conversation prefix (a
+    rolling digest over the messages so far), so a conversation that grows
+    by one turn only pays to tokenize the new message.
+    """
+
+    def __init__(self, completion_reserve: int, cache_entries: int = 50000):
+        self.completion_reserve = completion_reserve
+        self._messages = _LRU(cache_entries)
+        self._prefixes = _LRU(cache_entries)
+
+    def context_tokens(self, model: str) -> int:
+        return openai_models_info.get(model, {}).get("max_tokens", DEFAULT_CONTEXT_TOKENS)
+
+    def count_message(self, message: dict, model: str) -> int:
+        serialized = json.dumps(message, sort_keys=True, default=str)
+        key = (model, hashlib.sha1(serialized.encode()).hexdigest())
+        tokens = self._messages.get(key)
+        if tokens is None:
+            content = message.get("content")
+            if content is None:
+                content = json.dumps(message.get("function_call") or "")
+            tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(str(content), model)
+            if message.get("name"):
+                tokens += count_text_tokens(message["name"], model)
+            self._messages.set(key, tokens)
+        return tokens
+
+    def count_messages(self, messages: List[dict], model: str) -> List[int]:
+        counts = []
+        digest = hashlib.sha1(model.encode())
+        previous_total = 0
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True, default=str).encode())
+            prefix_key = digest.hexdigest()
+            total = self._prefixes.get(prefix_key)
+            if total is None:
+                total = previous_total + self.count_message(message, model)
+                self._prefixes.set(prefix_key, total)
+            counts.append(total - previous_total)
+            previous_total = total
+        return counts
+
+    def trim(self, messages: List[dict], model: str, reserve_tokens: int = 0, completion_reserve: int = None) -> Tuple[List[dict], dict]:
+        # keeps system messages and the latest message, dropping the oldest turns first
+        completion_reserve = self.completion_reserve if completion_reserve is None else completion_reserve
+        budget = max(self.context_tokens(model) - reserve_tokens - completion_reserve, 0)
+        counts = self.count_messages(messages, model)
+        tokens_before = sum(counts)
+
+        keep = [True] * len(messages)
+        total = tokens_before
+        for index, message in enumerate(messages[:-1]):
+            if total <= budget:
+                break
+            if message.get("role") == "system":
+                continue
+            keep[index] = False
+            total -= counts[index]
+
+        trimmed = [message for message, kept in zip(messages, keep) if kept]
+        return trimmed, {
+            "model": model,
+            "budget_tokens": budget,
+            "reserved_tokens": reserve_tokens + completion_reserve,
+            "tokens_before": tokens_before,
+            "tokens_after": total,
+            "tokens_saved": tokens_before - total,
+            "messages_dropped": len(messages) - len(trimmed),
+        }
+
+    def function_tokens(self, functions, model: str) -> int:
+        return count_text_tokens(json.dumps(functions or []), model)
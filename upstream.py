@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Callable, Optional
+
+
+class UpstreamBusy(Exception):
+    pass
+
+
+class UpstreamTimeout(Exception):
+    pass
+
+
+class UpstreamExecutor:
+    """Runs slow upstream calls (OpenAI, plugin APIs) on a bounded shared pool.
+
+    The in-flight limit is enforced without queueing: when every slot is taken
+    the call fails immediately with UpstreamBusy instead of piling up behind
+    the others. A caller that waits longer than the timeout gets
+    UpstreamTimeout back while the upstream call finishes in the background
+    and frees its slot.
+    """
+
+    def __init__(self, max_in_flight: int, timeout: float):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upstream")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise UpstreamBusy(f"More than {self.max_in_flight} upstream calls in flight")
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise UpstreamTimeout(f"Upstream call did not finish within {timeout} seconds")
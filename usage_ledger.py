@@ -0,0 +1,167 @@
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class UsageLedger:
+    """Write-behind usage counts per early-access token, plugin and hour.
+
+    `record` only bumps an in-memory counter. A background thread flushes
+    the pending counts with one `bulk_write` per collection every
+    `flush_interval` seconds, or sooner once `flush_size` distinct counters
+    are pending. Each flush updates hourly documents and the per token and
+    per plugin totals that `summary` reads, so /admin never scans raw usage.
+    Failed flushes are merged back and retried on the next cycle.
+    """
+
+    def __init__(self, hourly, totals, flush_interval: float, flush_size: int):
+        self.hourly = hourly
+        self.totals = totals
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: Dict[Tuple[str, str, datetime], list] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._indexes_ready = False
+        self._stats = {"recorded": 0, "flushes": 0, "flushed_counters": 0, "flush_errors": 0}
+
+    def start(self):
+        # a thread inherited through fork is no longer running
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def record(self, token: str, plugin_name: str):
+        now = datetime.utcnow()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            counter = self._pending.setdefault((token, plugin_name or "", hour), [0, now])
+            counter[0] += 1
+            counter[1] = now
+            self._stats["recorded"] += 1
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.hourly.create_index([("token", 1), ("hour", -1)])
+        self.totals.create_index("token")
+        self._indexes_ready = True
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            hourly_ops = []
+            totals = {}
+            for (token, plugin_name, hour), (count, last_used) in pending.items():
+                hourly_ops.append(UpdateOne(
+                    {"_id": f"{token}:{plugin_name}:{hour:%Y%m%d%H}"},
+                    {
+                        "$inc": {"count": count},
+                        "$max": {"last_used": last_used},
+                        "$setOnInsert": {"token": token, "plugin_name": plugin_name, "hour": hour},
+                    },
+                    upsert=True,
+                ))
+                # one totals document per token and per (token, plugin)
+                for key in ((token, None), (token, plugin_name)):
+                    total = totals.setdefault(key, [0, last_used])
+                    total[0] += count
+                    total[1] = max(total[1], last_used)
+            totals_ops = [
+                UpdateOne(
+                    {"_id": f"{token}:{plugin_name}" if plugin_name is not None else token},
+                    {
+                        "$inc": {"total_use": count},
+                        "$max": {"last_used": last_used},
+                        "$setOnInsert": {"token": token, "plugin_name": plugin_name},
+                    },
+                    upsert=True,
+                )
+                for (token, plugin_name), (count, last_used) in totals.items()
+            ]
+
+            try:
+                self._ensure_indexes()
+                self.hourly.bulk_write(hourly_ops, ordered=False)
+                self.totals.bulk_write(totals_ops, ordered=False)
+            except PyMongoError as e:
+                # a partially applied flush is counted again on retry; usage is approximate by design
+                logger.warning("usage ledger flush failed, retrying next cycle: %s", e)
+                with self._lock:
+                    for key, (count, last_used) in pending.items():
+                        counter = self._pending.setdefault(key, [0, last_used])
+                        counter[0] += count
+                        counter[1] = max(counter[1], last_used)
+                    self._stats["flush_errors"] += 1
+                return
+
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["flushed_counters"] += len(pending)
+
+    def summary(self, token: str, hours: int = 24) -> dict:
+        since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        total_use, last_used, plugins = 0, None, {}
+        for doc in self.totals.find({"token": token}):
+            if doc.get("plugin_name") is None:
+                total_use, last_used = doc.get("total_use", 0), doc.get("last_used")
+            else:
+                plugins[doc["plugin_name"]] = doc.get("total_use", 0)
+        recent = {}
+        for doc in self.hourly.find({"token": token, "hour": {"$gte": since}}):
+            recent[doc["hour"]] = recent.get(doc["hour"], 0) + doc.get("count", 0)
+
+        # fold in counts that have not been flushed yet
+        with self._lock:
+            unflushed = [(key, *counter) for key, counter in self._pending.items() if key[0] == token]
+        for (_, plugin_name, hour), count, pending_used in unflushed:
+            total_use += count
+            last_used = max(last_used, pending_used) if last_used else pending_used
+            plugins[plugin_name] = plugins.get(plugin_name, 0) + count
+            if hour >= since:
+                recent[hour] = recent.get(hour, 0) + count
+
+        return {
+            "total_use": total_use,
+            "last_used": last_used,
+            f"last_{hours}h": sum(recent.values()),
+            "hourly": [{"hour": hour, "count": count} for hour, count in sorted(recent.items())],
+            "plugins": plugins,
+        }
+
+    def top_plugins(self, limit: int) -> List[str]:
+        # most used directory plugins across every token, from the persisted totals;
+        # lets a fresh worker know what is popular before it has served anything
+        pipeline = [
+            {"$match": {"plugin_name": {"$nin": [None, ""], "$not": {"$regex": "://"}}}},
+            {"$group": {"_id": "$plugin_name", "total_use": {"$sum": "$total_use"}}},
+            {"$sort": {"total_use": -1, "_id": 1}},
+            {"$limit": limit},
+        ]
+        return [doc["_id"] for doc in self.totals.aggregate(pipeline)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "pending_counters": len(self._pending)}